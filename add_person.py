@@ -7,8 +7,156 @@ import os
 import sys
 import time
 import argparse
+import threading
+import queue
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
-import face_recognition
+import numpy as np
+import dlib
+import face_recognition_models
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Detection runs on a frame shrunk by this factor; boxes are scaled back up
+DETECT_DOWNSCALE = 4
+
+# Upsampling passes for the dlib detectors (matches face_recognition's default)
+DLIB_UPSAMPLE = 1
+
+# OpenCV res10 SSD face detector (used with --model dnn)
+DNN_PROTOTXT = "models/deploy.prototxt"
+DNN_WEIGHTS = "models/res10_300x300_ssd_iter_140000.caffemodel"
+DNN_MIN_CONFIDENCE = 0.5
+
+# Rows at the top of the frame reserved for the status HUD
+HUD_HEIGHT = 70
+
+
+class VideoStream:
+    """Read frames on a background thread, keeping only the most recent one."""
+
+    def __init__(self, src=0, width=None, height=None, fps=None):
+        self.cap = cv2.VideoCapture(src)
+        # MJPG keeps USB bandwidth down and lets libjpeg-turbo do the decode
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+        # Don't let the driver queue stale frames behind the one we want
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.ret, self.frame = False, None
+        self.lock = threading.Lock()
+        self.new_frame = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def start(self):
+        self.ret, self.frame = self.cap.read()
+        self.new_frame.set()
+        self.thread = threading.Thread(target=self._update, daemon=True)
+        self.thread.start()
+        return self
+
+    def _update(self):
+        while not self.stopped:
+            ret, frame = self.cap.read()
+            with self.lock:
+                self.ret, self.frame = ret, frame
+            self.new_frame.set()
+            if not ret:
+                break
+
+    def read(self, timeout=2.0):
+        """Wait for a frame not handed out yet and return (ret, frame).
+
+        Each frame is returned once, so callers never re-process (or busy-spin
+        on) the same frame; the caller owns it and may draw on it.
+        """
+        if not self.new_frame.wait(timeout):
+            return False, None
+        with self.lock:
+            self.new_frame.clear()
+            frame, self.frame = self.frame, None
+            return self.ret and frame is not None, frame
+
+    def release(self):
+        self.stopped = True
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.cap.release()
+
+
+def _preview_worker(shm_name, shape, window_name, lock, frame_ready, keys, stop):
+    shm = SharedMemory(name=shm_name)
+    shared = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    local = np.empty(shape, dtype=np.uint8)
+    try:
+        while not stop.is_set():
+            if frame_ready.wait(0.05):
+                frame_ready.clear()
+                with lock:
+                    np.copyto(local, shared)
+                cv2.imshow(window_name, local)
+            key = cv2.waitKey(1) & 0xFF
+            if key != 0xFF:
+                keys.put(key)
+    finally:
+        cv2.destroyAllWindows()
+        del shared
+        shm.close()
+
+
+class PreviewProcess:
+    """Show frames from a separate process, handing them over via shared memory."""
+
+    def __init__(self, shape, window_name):
+        self.shape = tuple(shape)
+        self.shm = SharedMemory(create=True, size=int(np.prod(self.shape)))
+        self.buffer = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.lock = mp.Lock()
+        self.frame_ready = mp.Event()
+        self.stop = mp.Event()
+        self.keys = mp.Queue()
+        self.process = mp.Process(
+            target=_preview_worker,
+            args=(self.shm.name, self.shape, window_name, self.lock, self.frame_ready, self.keys, self.stop),
+            daemon=True,
+        )
+        self.process.start()
+
+    def show(self, frame):
+        if frame.shape != self.shape:
+            return
+        with self.lock:
+            np.copyto(self.buffer, frame)
+        self.frame_ready.set()
+
+    def poll_key(self) -> int:
+        try:
+            return self.keys.get_nowait()
+        except queue.Empty:
+            return 0xFF
+
+    def close(self):
+        self.stop.set()
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        del self.buffer
+        self.shm.close()
+        self.shm.unlink()
 
 
 def slugify_name(name: str) -> str:
@@ -16,25 +164,202 @@ def slugify_name(name: str) -> str:
     return "".join(ch for ch in slug if ch.isalnum() or ch == "_")
 
 
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _bgr_to_small_gray(frame, out):
+        # One pass over the frame: BGR -> luma and a DETECT_DOWNSCALE box filter
+        f = DETECT_DOWNSCALE
+        norm = 1.0 / (f * f)
+        for i in prange(out.shape[0]):
+            for j in range(out.shape[1]):
+                acc = 0.0
+                for di in range(f):
+                    for dj in range(f):
+                        y = i * f + di
+                        x = j * f + dj
+                        acc += 0.114 * frame[y, x, 0] + 0.587 * frame[y, x, 1] + 0.299 * frame[y, x, 2]
+                out[i, j] = np.uint8(min(255.0, acc * norm + 0.5))
+else:
+    _bgr_to_small_gray = None
+
+
+class DetectionBuffers:
+    """Resize/RGB buffers reused across frames by the single-frame detector.
+
+    These stay in ordinary pageable memory even for --model cnn: dlib copies
+    the image into its own tensor, whose host staging buffer is already
+    allocated with cudaMallocHost, so pinning this array would not change
+    the host-to-device transfer. Capture overlap comes from VideoStream.
+    """
+
+    def __init__(self):
+        self.shape = None
+        self.small = None
+        self.rgb = None
+        self.gray = None
+
+    def small_rgb(self, frame):
+        if frame.shape != self.shape:
+            h, w = frame.shape[:2]
+            size = (h // DETECT_DOWNSCALE, w // DETECT_DOWNSCALE, 3)
+            self.small = np.empty(size, dtype=np.uint8)
+            self.rgb = np.empty(size, dtype=np.uint8)
+            self.gray = np.empty(size[:2], dtype=np.uint8)
+            self.shape = frame.shape
+        cv2.resize(frame, (self.small.shape[1], self.small.shape[0]), dst=self.small)
+        np.copyto(self.rgb, self.small[:, :, ::-1])
+        return self.rgb
+
+    def small_gray(self, frame):
+        if frame.shape != self.shape:
+            self.small_rgb(frame)
+        _bgr_to_small_gray(frame, self.gray)
+        return self.gray
+
+
+def _small_rgb(frame):
+    small = cv2.resize(frame, (0, 0), fx=1.0 / DETECT_DOWNSCALE, fy=1.0 / DETECT_DOWNSCALE)
+    # Channel flip as a view; dlib rejects negative strides so compact it once
+    return np.ascontiguousarray(small[:, :, ::-1])
+
+
+def _upscale_locations(locations):
+    s = DETECT_DOWNSCALE
+    return [(t * s, r * s, b * s, l * s) for (t, r, b, l) in locations]
+
+
+def load_dnn_detector(prototxt, weights):
+    """Load the SSD face detector, preferring the CUDA backend when available."""
+    net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+    if hasattr(cv2, "cuda") and cv2.cuda.getCudaEnabledDeviceCount() > 0:
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+    else:
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    return net
+
+
+def _detect_faces_dnn(net, frame):
+    h, w = frame.shape[:2]
+    # The network resizes to 300x300 itself, so feed it the full-res BGR frame
+    blob = cv2.dnn.blobFromImage(frame, 1.0, (300, 300), (104.0, 117.0, 123.0), False, False)
+    net.setInput(blob)
+    detections = net.forward()
+
+    locations = []
+    for i in range(detections.shape[2]):
+        if detections[0, 0, i, 2] < DNN_MIN_CONFIDENCE:
+            continue
+        x1, y1, x2, y2 = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
+        left, top = max(0, int(x1)), max(0, int(y1))
+        right, bottom = min(w, int(x2)), min(h, int(y2))
+        if right > left and bottom > top:
+            locations.append((top, right, bottom, left))
+    return locations
+
+
+_dlib_detectors = {}
+
+
+def _get_dlib_detector(model):
+    """Load a dlib detector once and reuse it for every frame."""
+    if model not in _dlib_detectors:
+        if model == "cnn":
+            _dlib_detectors[model] = dlib.cnn_face_detection_model_v1(
+                face_recognition_models.cnn_face_detector_model_location()
+            )
+        else:
+            _dlib_detectors[model] = dlib.get_frontal_face_detector()
+    return _dlib_detectors[model]
+
+
+def _rects_to_locations(rects, shape):
+    h, w = shape[:2]
+    return [
+        (max(r.top(), 0), min(r.right(), w), min(r.bottom(), h), max(r.left(), 0))
+        for r in rects
+    ]
+
+
+def detect_faces(frame, model="hog", net=None, buffers=None):
+    """Detect faces in a BGR frame, returning full-res (top, right, bottom, left) boxes."""
+    if model == "dnn":
+        return _detect_faces_dnn(net, frame)
+    # dlib detectors run on a downscaled copy
+    if buffers is None:
+        image = _small_rgb(frame)
+    elif model == "hog" and _bgr_to_small_gray is not None:
+        # HOG works on intensity only, so hand dlib the fused gray downscale
+        image = buffers.small_gray(frame)
+    else:
+        image = buffers.small_rgb(frame)
+    detections = _get_dlib_detector(model)(image, DLIB_UPSAMPLE)
+    if model == "cnn":
+        detections = [d.rect for d in detections]
+    return _upscale_locations(_rects_to_locations(detections, image.shape))
+
+
+def detect_faces_batch(frames, batch_size):
+    """Run the CNN detector over several BGR frames in one batched call."""
+    images = [_small_rgb(f) for f in frames]
+    results = _get_dlib_detector("cnn")(images, DLIB_UPSAMPLE, batch_size=batch_size)
+    return [
+        _upscale_locations(_rects_to_locations([d.rect for d in detections], image.shape))
+        for image, detections in zip(images, results)
+    ]
+
+
 def get_largest_face(face_locations):
     if not face_locations:
         return None
-    return max(face_locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+    if len(face_locations) < 2:
+        return face_locations[0]
+    arr = np.asarray(face_locations)
+    areas = (arr[:, 2] - arr[:, 0]) * (arr[:, 1] - arr[:, 3])
+    return tuple(int(v) for v in arr[areas.argmax()])
 
 
-def save_face_crop(frame, face_location, save_path):
+def crop_face(frame, face_location):
     top, right, bottom, left = face_location
     h, w = frame.shape[:2]
 
-    # Add padding
+    # Add padding, clamped to the frame in one vectorized step
     pad = int(0.15 * max(bottom - top, right - left))
-    top = max(0, top - pad)
-    left = max(0, left - pad)
-    bottom = min(h, bottom + pad)
-    right = min(w, right + pad)
+    coords = np.clip([top - pad, left - pad, bottom + pad, right + pad], 0, [h, w, h, w])
+    top, left, bottom, right = coords.tolist()
+
+    return frame[top:bottom, left:right]
 
-    crop = frame[top:bottom, left:right]
-    cv2.imwrite(save_path, crop)
+
+def sharpness(image) -> float:
+    """Variance of the Laplacian; low values mean a blurry image."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def write_crop(crop, save_path, executor=None, quality=90):
+    # opencv-python wheels encode with libjpeg-turbo (SIMD); skip the slow
+    # optimized-Huffman pass
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+    if executor is None:
+        cv2.imwrite(save_path, crop, params)
+        return None
+    # Copy so the write doesn't race with the next frame; encode happens off-thread
+    return executor.submit(cv2.imwrite, save_path, crop.copy(), params)
+
+
+def save_face_crop(frame, face_location, save_path, executor=None, quality=90):
+    return write_crop(crop_face(frame, face_location), save_path, executor, quality)
+
+
+def render_hud(width, captured, count):
+    """Rasterize the status text once into an overlay strip and its mask."""
+    overlay = np.zeros((HUD_HEIGHT, width, 3), dtype=np.uint8)
+    cv2.putText(overlay, f"Capturing: {captured}/{count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    cv2.putText(overlay, "Press 'q' to quit", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
+    mask = cv2.cvtColor(overlay, cv2.COLOR_BGR2GRAY)
+    return overlay, mask
 
 
 def parse_args() -> argparse.Namespace:
@@ -44,7 +369,22 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--delay", type=float, default=0.6, help="Seconds between captures")
     parser.add_argument("--output-dir", default="known_faces", help="Directory to save images")
     parser.add_argument("--camera", type=int, default=0, help="Camera index (0,1,2...)")
-    parser.add_argument("--model", default="hog", choices=["hog", "cnn"], help="Face detection model")
+    parser.add_argument("--min-sharpness", type=float, default=80.0,
+                        help="Minimum Laplacian variance for a crop to be saved (0 disables)")
+    parser.add_argument("--jpeg-quality", type=int, default=90, help="JPEG quality for saved crops (0-100)")
+    parser.add_argument("--width", type=int, default=640, help="Requested camera frame width")
+    parser.add_argument("--height", type=int, default=480, help="Requested camera frame height")
+    parser.add_argument("--fps", type=int, default=30, help="Requested camera frame rate")
+    parser.add_argument("--model", "--detector", dest="model", default="hog", choices=["hog", "cnn", "dnn"],
+                        help="Face detection model (dnn = OpenCV SSD, CUDA if available)")
+    parser.add_argument("--dnn-prototxt", default=DNN_PROTOTXT, help="SSD detector prototxt (--model dnn)")
+    parser.add_argument("--dnn-weights", default=DNN_WEIGHTS, help="SSD detector caffemodel (--model dnn)")
+    parser.add_argument("--detect-every", type=int, default=5,
+                        help="Run face detection every N frames between captures")
+    parser.add_argument("--batch", type=int, default=4,
+                        help="Frames per batched detector call with --model cnn (1 disables)")
+    parser.add_argument("--preview-process", action="store_true",
+                        help="Show the preview window from a separate process")
     return parser.parse_args()
 
 
@@ -53,6 +393,7 @@ def main() -> int:
 
     os.makedirs(args.output_dir, exist_ok=True)
     person_slug = slugify_name(args.name)
+    path_prefix = os.path.join(args.output_dir, person_slug)
 
     print("Webcam Face Capture")
     print("=" * 50)
@@ -62,13 +403,39 @@ def main() -> int:
     print(" - Press 'q' to quit early")
     print("=" * 50)
 
-    cap = cv2.VideoCapture(args.camera)
+    net = None
+    if args.model == "dnn":
+        if not (os.path.exists(args.dnn_prototxt) and os.path.exists(args.dnn_weights)):
+            print(f"Error: DNN model files not found ({args.dnn_prototxt}, {args.dnn_weights})")
+            return 1
+        net = load_dnn_detector(args.dnn_prototxt, args.dnn_weights)
+
+    cap = VideoStream(args.camera, args.width, args.height, args.fps)
     if not cap.isOpened():
         print("Error: Could not open camera")
+        cap.release()
         return 1
+    cap.start()
 
     captured = 0
     last_capture_time = 0.0
+    frame_idx = 0
+    largest = None
+    use_batch = args.model == "cnn" and args.batch > 1
+    pending = deque(maxlen=max(1, args.batch))
+    window_name = "Capture - " + args.name
+    hud = None
+    hud_key = None
+    writer = ThreadPoolExecutor(max_workers=2)
+    buffers = DetectionBuffers()
+
+    # Warm up the detector (model load, CUDA init, Numba JIT, buffer allocation)
+    # on a blank frame so the first live frame doesn't stall
+    ret, frame = cap.read()
+    warmup = np.zeros_like(frame) if ret else np.zeros((64, 64, 3), dtype=np.uint8)
+    detect_faces(warmup, args.model, net, buffers)
+
+    preview = PreviewProcess(frame.shape, window_name) if args.preview_process and ret else None
 
     try:
         while captured < args.count:
@@ -77,9 +444,45 @@ def main() -> int:
                 print("Error: Failed to read frame from camera")
                 break
 
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame, model=args.model)
-            largest = get_largest_face(face_locations)
+            now = time.time()
+            capture_due = now - last_capture_time >= args.delay
+
+            detected = False
+            source_frame = frame
+            # Only detect periodically; always detect when a capture is due so
+            # the saved crop uses a fresh box
+            if capture_due or frame_idx % max(1, args.detect_every) == 0:
+                if use_batch:
+                    # Keep an undrawn copy so the crop can come from the frame the box belongs to
+                    pending.append(frame.copy())
+                    if len(pending) == pending.maxlen:
+                        batch_results = detect_faces_batch(list(pending), args.batch)
+                        largest = None
+                        # Prefer the newest frame in the batch that contains a face
+                        for batch_frame, face_locations in zip(reversed(pending), reversed(batch_results)):
+                            largest = get_largest_face(face_locations)
+                            if largest is not None:
+                                source_frame = batch_frame
+                                break
+                        pending.clear()
+                        detected = True
+                else:
+                    face_locations = detect_faces(frame, args.model, net, buffers)
+                    largest = get_largest_face(face_locations)
+                    detected = True
+            frame_idx += 1
+
+            # Crop before anything is drawn on the frame, reusing the box we
+            # already have at full resolution rather than detecting again
+            if largest is not None and capture_due and detected:
+                crop = crop_face(source_frame, largest)
+                # Blurry crops make poor encodings; wait for a sharper frame
+                if args.min_sharpness <= 0 or sharpness(crop) >= args.min_sharpness:
+                    save_path = f"{path_prefix}_{captured+1:02d}.jpg"
+                    write_crop(crop, save_path, writer, args.jpeg_quality)
+                    captured += 1
+                    last_capture_time = now
+                    print(f"Saved: {save_path}")
 
             # Draw box and HUD
             if largest is not None:
@@ -87,28 +490,28 @@ def main() -> int:
                 cv2.rectangle(frame, (l, t), (r, b), (0, 255, 0), 2)
                 cv2.putText(frame, f"Face detected", (l, max(0, t - 10)), cv2.FONT_HERSHEY_DUPLEX, 0.6, (0, 255, 0), 1)
 
-            cv2.putText(frame, f"Capturing: {captured}/{args.count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            cv2.putText(frame, "Press 'q' to quit", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
-            cv2.imshow("Capture - " + args.name, frame)
-
-            key = cv2.waitKey(1) & 0xFF
+            # Re-rasterize the HUD only when the counter (or frame width) changes
+            if hud_key != (captured, frame.shape[1]):
+                hud = render_hud(frame.shape[1], captured, args.count)
+                hud_key = (captured, frame.shape[1])
+            hud_rows = frame[:HUD_HEIGHT]
+            cv2.copyTo(hud[0][:hud_rows.shape[0]], hud[1][:hud_rows.shape[0]], hud_rows)
+            if preview is not None:
+                preview.show(frame)
+                key = preview.poll_key()
+            else:
+                cv2.imshow(window_name, frame)
+                key = cv2.waitKey(1) & 0xFF
             if key == ord('q') or key == 27:
                 break
 
-            now = time.time()
-            if largest is not None and now - last_capture_time >= args.delay:
-                filename = f"{person_slug}_{captured+1:02d}.jpg"
-                save_path = os.path.join(args.output_dir, filename)
-                # Use original BGR frame for saving
-                save_face_crop(frame, largest, save_path)
-                captured += 1
-                last_capture_time = now
-                print(f"Saved: {save_path}")
-
         print(f"Finished. Captured {captured} image(s).")
         return 0 if captured > 0 else 2
 
     finally:
+        if preview is not None:
+            preview.close()
+        writer.shutdown(wait=True)
         cap.release()
         cv2.destroyAllWindows()
 
@@ -4,20 +4,58 @@ Face Recognition Web Dashboard
 A complete web interface for student management and face recognition
 """
 
-from flask import Flask, render_template, request, jsonify, Response, send_from_directory
+import os
+
+# Let OpenBLAS/OpenMP (used by numpy and dlib) use every core; must be set
+# before those libraries are imported. Explicit environment values win.
+os.environ.setdefault('OPENBLAS_NUM_THREADS', str(os.cpu_count() or 1))
+os.environ.setdefault('OMP_NUM_THREADS', str(os.cpu_count() or 1))
+
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory, stream_with_context
 import cv2
+import dlib
 import face_recognition
 import numpy as np
 import pickle
-import os
 from pathlib import Path
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from PIL import Image
 import base64
+import io
 import json
 from datetime import datetime
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils import as_encoding_matrix, create_face_tracker, nearest_encodings, warm_up_matchers
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJPF_RGB, TJSAMP_420
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError):
+    # PyTurboJPEG missing or libjpeg-turbo not found - use OpenCV's encoder
+    _turbo_jpeg = None
+
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+
+    class ORJSONProvider(DefaultJSONProvider):
+        """jsonify() through orjson; keeps Flask's sorted keys and fallback types"""
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+except ImportError:
+    ORJSONProvider = None
 
 app = Flask(__name__)
+if ORJSONProvider is not None:
+    app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = 'face-recognition-dashboard-2026'
 app.config['UPLOAD_FOLDER'] = 'images'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
@@ -27,6 +65,22 @@ app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg'}
 IMAGES_DIR = Path("images")
 ENCODINGS_DIR = Path("encodings")
 ENCODINGS_FILE = ENCODINGS_DIR / "known_faces.pkl"
+ENCODINGS_NPZ = ENCODINGS_DIR / "known_faces.npz"
+
+# Box colors for a match: >80% (bright green), >70% (lime green), otherwise (cyan)
+MATCH_COLORS = [(0, 255, 0), (50, 205, 50), (0, 200, 200)]
+
+# Dashboard grid thumbnails live in images/<student>/_thumbs/
+THUMBS_DIRNAME = "_thumbs"
+THUMB_SIZE = 256
+
+# JPEG quality for the MJPEG video stream
+STREAM_JPEG_QUALITY = 75
+
+# Photos are shrunk to this longest side before encoding; the CNN detector
+# batches this many same-sized photos per call when dlib has CUDA
+ENCODE_MAX_SIDE = 800
+ENCODE_BATCH_SIZE = 32
 
 # Ensure directories exist
 IMAGES_DIR.mkdir(exist_ok=True)
@@ -34,24 +88,37 @@ ENCODINGS_DIR.mkdir(exist_ok=True)
 
 # Global variables for video stream
 camera = None
-known_encodings = []
-known_names = []
+# (encodings, half_norm_sq, names): the (N, 128) float32 matrix, ||k||^2 / 2 per
+# row and the name per row. Replaced as a whole, so readers take one reference
+# and never see a matrix paired with another gallery's norms or names
+known_gallery = (np.empty((0, 128), dtype=np.float32), np.empty(0, dtype=np.float32), [])
 recognition_active = False
 
 # Attendance tracking
 from datetime import date, timedelta
-attendance_records = {}  # {date: {student_name: timestamp}}
+from collections import defaultdict
+attendance_times = {}  # {date: {student_name: timestamp}}
+attendance_sets = defaultdict(set)  # {date: {student_name}} - kept in step with attendance_times
 current_session_attendance = set()  # Students marked present in current session
-last_recognition_time = {}  # {student_name: timestamp} - for duplicate prevention
+last_recognition_time = {}  # {student_name: time.monotonic()} - for duplicate prevention
+
+class RecognitionStatus:
+    """Immutable snapshot of the latest processed frame
+    
+    The video loop publishes a new snapshot with a single global assignment,
+    so /api/recognition/status never sees a half-updated frame.
+    """
+    __slots__ = ('faces_detected', 'no_face', 'too_dark', 'brightness', 'last_update')
+    
+    def __init__(self, faces_detected=(), no_face=False, too_dark=False, brightness=0.0, last_update=None):
+        self.faces_detected = faces_detected  # Tuple of {name, confidence}
+        self.no_face = no_face
+        self.too_dark = too_dark
+        self.brightness = brightness
+        self.last_update = last_update  # time.time() of the frame, or None
 
 # Real-time recognition status for sound/voice feedback
-current_recognition_status = {
-    'faces_detected': [],  # List of {name, confidence}
-    'no_face': False,
-    'too_dark': False,
-    'brightness': 0,
-    'last_update': None
-}
+current_recognition_status = RecognitionStatus()
 
 # Enhanced settings
 SETTINGS = {
@@ -62,22 +129,161 @@ SETTINGS = {
     'enable_emotion': False,  # Emotion detection (requires additional setup)
     'dark_mode': False,  # Dark mode theme
     'auto_face_detection': True,  # Reject photos without faces (set to False to allow all photos)
-    'min_face_size': 0.02  # Minimum face size relative to image (0.02 = 2% of image)
+    'min_face_size': 0.02,  # Minimum face size relative to image (0.02 = 2% of image)
+    'detection_upsample': 1,  # HOG upsampling on the 1/4-size live frame (0 = ~4x less work, but only finds faces 320px+ wide)
+    'stream_min_face_size': 0.005  # Drop live detections smaller than this fraction of the frame (0 = keep all)
 }
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def set_known_encodings(encodings, names):
+    """Publish a new gallery: matrix, cached (halved) squared row norms and names"""
+    global known_gallery
+    matrix = as_encoding_matrix(encodings)
+    known_gallery = (matrix, 0.5 * np.einsum('ij,ij->i', matrix, matrix), list(names))
+
+def match_faces(face_encodings, gallery):
+    """Find the nearest known encoding for every query face
+    
+    `gallery` is a known_gallery snapshot taken by the caller.
+    
+    Returns:
+        tuple: (best_idx, best_d2) arrays, one entry per query face; best_d2 is
+        the *squared* distance, so compare it against a squared threshold
+    """
+    known_encodings, known_half_norm_sq, _ = gallery
+    return nearest_encodings(known_encodings, as_encoding_matrix(face_encodings), known_half_norm_sq)
+
+def encode_jpeg(frame):
+    """Encode a BGR frame for the MJPEG stream (libjpeg-turbo if available)"""
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(frame, quality=STREAM_JPEG_QUALITY,
+                                  pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, STREAM_JPEG_QUALITY,
+                                               cv2.IMWRITE_JPEG_OPTIMIZE, 0])
+    return buffer.tobytes()
+
+class CameraReader:
+    """Grab camera frames on a daemon thread, keeping only the newest one
+    
+    Recognition always works on the freshest frame; frames that arrive while
+    a slow frame is being processed are dropped instead of queuing up.
+    """
+    
+    def __init__(self, index=0):
+        self.capture = cv2.VideoCapture(index)
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Keep the driver queue shallow
+        self._lock = threading.Lock()
+        self._new_frame = threading.Event()
+        self._frame = None
+        self._ok = True
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while self._running:
+            ok, frame = self.capture.read()
+            with self._lock:
+                self._ok = ok
+                if ok:
+                    self._frame = frame
+            self._new_frame.set()
+            if not ok:
+                break
+    
+    def read(self, timeout=2.0):
+        """Return (success, frame) for the newest frame not handed out yet"""
+        if not self._new_frame.wait(timeout):
+            return False, None
+        with self._lock:
+            self._new_frame.clear()
+            frame, self._frame = self._frame, None
+            return self._ok and frame is not None, frame
+    
+    def release(self):
+        self._running = False
+        self._thread.join(timeout=1.0)
+        self.capture.release()
+
+def render_info_panel(width, face_count, too_dark):
+    """Render the black status panel shown across the top of the stream"""
+    panel = np.zeros((80, width, 3), dtype=np.uint8)
+    
+    # Show face count and status
+    cv2.putText(panel, f"👥 Faces Detected: {face_count}", (20, 30),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    
+    if too_dark:
+        cv2.putText(panel, "⚠️  WARNING: TOO DARK!", (20, 60),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2)
+    elif face_count == 0:
+        cv2.putText(panel, "❌ No faces detected", (20, 60),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    else:
+        cv2.putText(panel, "✅ Multi-Student Recognition Active", (20, 60),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    return panel
+
+def render_attendance_panel(rows):
+    """Render the bottom-left attendance list
+    
+    Args:
+        rows: (name, time_marked or None, progress_percent) per recognized student
+    """
+    panel_height = min(200, 30 + len(rows) * 30)
+    panel = np.zeros((panel_height, 350, 3), dtype=np.uint8)
+    
+    y_offset = 25
+    present_count = sum(1 for _, marked_at, _ in rows if marked_at is not None)
+    cv2.putText(panel, f"📋 Attendance: {present_count}/{len(rows)}", (10, y_offset),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    y_offset += 30
+    
+    for person, marked_at, progress in rows:
+        # Show status
+        if marked_at is not None:
+            prefix = "✅"
+            time_str = f" - {marked_at}"
+            color_code = (0, 255, 0)
+        else:
+            prefix = f"○ {progress}%"
+            time_str = ""
+            color_code = (255, 255, 0)
+        
+        cv2.putText(panel, f"{prefix} {person}{time_str}", (15, y_offset),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, color_code, 1)
+        y_offset += 28
+    return panel
+
+def warm_up_models():
+    """Run the dlib detector and encoder (and compile the matchers) once so the first video frame doesn't stall"""
+    dummy = np.zeros((120, 160, 3), np.uint8)
+    face_recognition.face_locations(dummy)
+    face_recognition.face_encodings(dummy, [(0, 159, 119, 0)])
+    warm_up_matchers()
+
 def load_encodings():
-    """Load face encodings from file"""
-    global known_encodings, known_names
+    """Load face encodings from file
+    
+    Prefers the .npz gallery; falls back to the legacy pickle when the .npz
+    is missing or older (e.g. after encode_faces.py rewrote the pickle).
+    """
+    if ENCODINGS_NPZ.exists() and (not ENCODINGS_FILE.exists()
+                                   or ENCODINGS_NPZ.stat().st_mtime >= ENCODINGS_FILE.stat().st_mtime):
+        try:
+            with np.load(ENCODINGS_NPZ) as data:
+                set_known_encodings(data['enc'], [str(name) for name in data['names']])
+            return True
+        except Exception as e:
+            print(f"Error loading encodings: {e}")
     
     if ENCODINGS_FILE.exists():
         try:
             with open(ENCODINGS_FILE, 'rb') as f:
                 data = pickle.load(f)
-                known_encodings = data.get('encodings', [])
-                known_names = data.get('names', [])
+                set_known_encodings(data.get('encodings', []), data.get('names', []))
                 return True
         except Exception as e:
             print(f"Error loading encodings: {e}")
@@ -86,13 +292,21 @@ def load_encodings():
 
 def save_encodings():
     """Save face encodings to file"""
+    known_encodings, _, known_names = known_gallery
+    
+    # Legacy pickle, still read by recognize.py and friends
     data = {
-        'encodings': known_encodings,
+        # Stored as a list of vectors so utils.load_encodings_from_file keeps working
+        'encodings': list(known_encodings),
         'names': known_names,
         'num_faces': len(known_names)
     }
     with open(ENCODINGS_FILE, 'wb') as f:
         pickle.dump(data, f)
+    
+    # Written last: loaders only prefer an .npz at least as new as the pickle
+    np.savez_compressed(ENCODINGS_NPZ, enc=as_encoding_matrix(known_encodings),
+                        names=np.asarray(known_names, dtype=str))
 
 def encode_faces_for_student(student_name):
     """Encode all faces for a specific student"""
@@ -104,7 +318,7 @@ def encode_faces_for_student(student_name):
     for img_file in student_dir.glob("*.*"):
         if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
             try:
-                image = face_recognition.load_image_file(str(img_file))
+                image = decode_image_rgb(img_file.read_bytes())
                 face_locations = face_recognition.face_locations(image)
                 if face_locations:
                     face_encodings = face_recognition.face_encodings(image, face_locations)
@@ -115,41 +329,166 @@ def encode_faces_for_student(student_name):
     
     return len(encodings)
 
+def decode_image_rgb(raw, max_side=None):
+    """Decode photo bytes to an RGB array
+    
+    JPEGs go through libjpeg-turbo when available; with max_side it also uses
+    DCT scaling (1/2, 1/4, 1/8) to skip pixels that would be resized away.
+    PNGs and everything else use Pillow via face_recognition.
+    """
+    if _turbo_jpeg is not None and raw[:2] == b'\xff\xd8':
+        scaling_factor = None
+        if max_side:
+            width, height = _turbo_jpeg.decode_header(raw)[:2]
+            for denom in (8, 4, 2):
+                if max(width, height) // denom >= max_side:
+                    scaling_factor = (1, denom)
+                    break
+        return _turbo_jpeg.decode(raw, pixel_format=TJPF_RGB, scaling_factor=scaling_factor)
+    return face_recognition.load_image_file(io.BytesIO(raw))
+
+def load_image_for_encoding(img_file):
+    """Load an RGB photo, downscaled so its longest side is at most ENCODE_MAX_SIDE"""
+    image = decode_image_rgb(Path(img_file).read_bytes(), max_side=ENCODE_MAX_SIDE)
+    scale = ENCODE_MAX_SIDE / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+def encode_photo(img_file):
+    """Encode the first face in a photo; returns None if there is no face"""
+    try:
+        image = load_image_for_encoding(img_file)
+        face_locations = face_recognition.face_locations(image)
+        if not face_locations:
+            return None
+        face_encodings = face_recognition.face_encodings(image, face_locations[:1], num_jitters=1)
+        return face_encodings[0] if face_encodings else None
+    except Exception as e:
+        print(f"Error encoding {img_file}: {e}")
+        return None
+
+def encode_photos_batched(img_files):
+    """Encode photos with batched CNN detection on the GPU"""
+    images = []
+    for img_file in img_files:
+        try:
+            images.append(load_image_for_encoding(img_file))
+        except Exception as e:
+            print(f"Error encoding {img_file}: {e}")
+            images.append(None)
+    
+    # dlib's batched CNN call needs equally sized images, so batch per shape
+    locations = [None] * len(images)
+    by_shape = {}
+    for idx, image in enumerate(images):
+        if image is not None:
+            by_shape.setdefault(image.shape, []).append(idx)
+    for indices in by_shape.values():
+        results = face_recognition.batch_face_locations(
+            [images[i] for i in indices], number_of_times_to_upsample=0, batch_size=ENCODE_BATCH_SIZE
+        )
+        for i, face_locations in zip(indices, results):
+            locations[i] = face_locations
+    
+    encodings = []
+    for img_file, image, face_locations in zip(img_files, images, locations):
+        encoding = None
+        if face_locations:
+            try:
+                face_encodings = face_recognition.face_encodings(image, face_locations[:1], num_jitters=1)
+                encoding = face_encodings[0] if face_encodings else None
+            except Exception as e:
+                print(f"Error encoding {img_file}: {e}")
+        encodings.append(encoding)
+    return encodings
+
+def encode_photos(img_files):
+    """Encode many photos: batched on the GPU with CUDA dlib, else across CPU cores"""
+    if dlib.DLIB_USE_CUDA:
+        return encode_photos_batched(img_files)
+    
+    workers = os.cpu_count() or 1
+    if workers < 2 or len(img_files) < 2:
+        return [encode_photo(img_file) for img_file in img_files]
+    
+    # dlib's HOG detector and ResNet run on one core per call and release the
+    # GIL, so threads fan photos out without forking the server process
+    with ThreadPoolExecutor(max_workers=min(workers, len(img_files))) as pool:
+        return list(pool.map(encode_photo, img_files))
+
 def rebuild_all_encodings():
     """Rebuild all encodings from scratch"""
-    global known_encodings, known_names
-    
-    known_encodings = []
-    known_names = []
+    encodings = []
+    names = []
     
     total_encoded = 0
     
+    photos = []  # [(student_name, img_file)]
     for student_dir in IMAGES_DIR.iterdir():
         if student_dir.is_dir():
             student_name = student_dir.name
             
             for img_file in student_dir.glob("*.*"):
                 if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                    try:
-                        image = face_recognition.load_image_file(str(img_file))
-                        face_locations = face_recognition.face_locations(image)
-                        
-                        if face_locations:
-                            face_encodings = face_recognition.face_encodings(image, face_locations)
-                            if face_encodings:
-                                known_encodings.append(face_encodings[0])
-                                known_names.append(student_name)
-                                total_encoded += 1
-                    except Exception as e:
-                        print(f"Error encoding {img_file}: {e}")
-    
-    if known_encodings:
+                    photos.append((student_name, img_file))
+    
+    results = encode_photos([img_file for _, img_file in photos])
+    for (student_name, _), encoding in zip(photos, results):
+        if encoding is not None:
+            encodings.append(encoding)
+            names.append(student_name)
+            total_encoded += 1
+    
+    # Publish only now, names together with the matrix they index
+    set_known_encodings(encodings, names)
+    if encodings:
         save_encodings()
     
     return total_encoded
 
-def get_all_students():
-    """Get list of all students with their info"""
+def record_attendance(day, student_name, time_str):
+    """Mark a student present on `day` in both attendance structures"""
+    attendance_times.setdefault(day, {})[student_name] = time_str
+    attendance_sets[day].add(student_name)
+
+def remove_attendance(day, student_name):
+    """Undo record_attendance for one student"""
+    attendance_times.get(day, {}).pop(student_name, None)
+    attendance_sets[day].discard(student_name)
+
+# {'mtime', 'students', 'names_lower', 'total_photos'} built from one scan of
+# images/; kept until the next mutation or until images/ changes on disk
+_students_cache = None
+
+def invalidate_students_cache():
+    """Forget the cached student list after images are added/removed/renamed"""
+    global _students_cache
+    _students_cache = None
+
+def make_thumbnail(photo_path):
+    """Write a THUMB_SIZE thumbnail of a photo into its student's _thumbs/ folder"""
+    thumbs_dir = photo_path.parent / THUMBS_DIRNAME
+    thumbs_dir.mkdir(exist_ok=True)
+    try:
+        with Image.open(photo_path) as img:
+            img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+            img.save(thumbs_dir / photo_path.name)
+    except Exception as e:
+        print(f"Error creating thumbnail for {photo_path}: {e}")
+
+def get_students_cache():
+    """Scan images/ into _students_cache if it is empty or stale, and return it
+    
+    Cached until invalidated by a dashboard route, or until images/ itself
+    changes (e.g. a student folder added by add_person.py).
+    """
+    global _students_cache
+    cache = _students_cache
+    mtime = IMAGES_DIR.stat().st_mtime_ns
+    if cache is not None and cache['mtime'] == mtime:
+        return cache
+    
     students = []
     
     for student_dir in IMAGES_DIR.iterdir():
@@ -163,7 +502,24 @@ def get_all_students():
                 'images': [img.name for img in images]
             })
     
-    return sorted(students, key=lambda x: x['name'])
+    students.sort(key=lambda x: x['name'])
+    cache = {
+        'mtime': mtime,
+        'students': students,
+        'names_lower': [s['name'].lower() for s in students],
+        'total_photos': sum(s['image_count'] for s in students)
+    }
+    _students_cache = cache
+    return cache
+
+def get_all_students():
+    """Get list of all students with their info"""
+    return get_students_cache()['students']
+
+def get_students_with_lower_names():
+    """Pairs of (student, lowercased name) for search, lowered once per cache fill"""
+    cache = get_students_cache()
+    return zip(cache['students'], cache['names_lower'])
 
 @app.route('/')
 def index():
@@ -221,15 +577,12 @@ def api_add_student():
             filename = secure_filename(file.filename)
             ext = filename.rsplit('.', 1)[1].lower()
             
-            # Save temporarily to check for faces
-            temp_path = student_dir / f"temp.{ext}"
-            file.save(temp_path)
-            
             # Check if auto face detection is enabled
             if SETTINGS.get('auto_face_detection', True):
-                # Check if face exists in image
+                # Decode from memory; only accepted photos ever touch the disk
+                raw = file.read()
                 try:
-                    image = face_recognition.load_image_file(str(temp_path))
+                    image = decode_image_rgb(raw)
                     face_locations = face_recognition.face_locations(image)
                     
                     if face_locations:
@@ -241,36 +594,35 @@ def api_add_student():
                         face_ratio = (face_width * face_height) / (img_width * img_height)
                         
                         if face_ratio >= SETTINGS.get('min_face_size', 0.02):
-                            # Good quality - keep the file
+                            # Good quality - keep the original bytes
                             new_filename = f"{student_name}_{saved_count + 1:03d}.{ext}"
-                            temp_path.rename(student_dir / new_filename)
+                            (student_dir / new_filename).write_bytes(raw)
+                            make_thumbnail(student_dir / new_filename)
                             saved_count += 1
                             quality = "Good" if face_ratio > 0.1 else "Acceptable"
                             face_quality_info.append(f"{filename}: {quality} (face size: {face_ratio*100:.1f}%)")
                         else:
                             # Face too small
-                            temp_path.unlink()
                             rejected_count += 1
                             rejected_files.append(f"{filename} (face too small)")
                     else:
                         # No face detected - reject
-                        temp_path.unlink()
                         rejected_count += 1
                         rejected_files.append(f"{filename} (no face detected)")
                 except Exception as e:
                     print(f"Error processing {filename}: {e}")
-                    if temp_path.exists():
-                        temp_path.unlink()
                     rejected_count += 1
                     rejected_files.append(f"{filename} (processing error)")
             else:
                 # Auto detection disabled - save all files
                 new_filename = f"{student_name}_{saved_count + 1:03d}.{ext}"
-                temp_path.rename(student_dir / new_filename)
+                file.save(student_dir / new_filename)
+                make_thumbnail(student_dir / new_filename)
                 saved_count += 1
     
     if saved_count == 0:
         student_dir.rmdir()
+        invalidate_students_cache()
         error_msg = 'No valid images with faces detected'
         if rejected_files:
             error_msg += f'. Rejected: {", ".join(rejected_files[:3])}'
@@ -289,6 +641,7 @@ def api_add_student():
     # Encode faces
     encoded = encode_faces_for_student(student_name)
     rebuild_all_encodings()
+    invalidate_students_cache()
     
     message = f'✅ Added {student_name} with {saved_count} image{"s" if saved_count != 1 else ""}'
     if rejected_count > 0:
@@ -314,6 +667,7 @@ def api_delete_student(student_name):
     
     shutil.rmtree(student_dir)
     rebuild_all_encodings()
+    invalidate_students_cache()
     
     return jsonify({'success': True, 'message': f'Deleted {student_name}'})
 
@@ -337,6 +691,7 @@ def api_rename_student(student_name):
     
     student_dir.rename(new_dir)
     rebuild_all_encodings()
+    invalidate_students_cache()
     
     return jsonify({'success': True, 'message': f'Renamed {student_name} to {new_name}'})
 
@@ -362,12 +717,14 @@ def api_add_photos(student_name):
             ext = filename.rsplit('.', 1)[1].lower()
             new_filename = f"{student_name}_{current_count + saved_count + 1:03d}.{ext}"
             file.save(student_dir / new_filename)
+            make_thumbnail(student_dir / new_filename)
             saved_count += 1
     
     if saved_count == 0:
         return jsonify({'error': 'No valid images uploaded'}), 400
     
     rebuild_all_encodings()
+    invalidate_students_cache()
     
     return jsonify({
         'success': True,
@@ -383,7 +740,11 @@ def api_delete_photo(student_name, photo_name):
         return jsonify({'error': 'Photo not found'}), 404
     
     photo_path.unlink()
+    thumb_path = photo_path.parent / THUMBS_DIRNAME / photo_name
+    if thumb_path.exists():
+        thumb_path.unlink()
     rebuild_all_encodings()
+    invalidate_students_cache()
     
     return jsonify({'success': True, 'message': f'Deleted {photo_name}'})
 
@@ -391,6 +752,7 @@ def api_delete_photo(student_name, photo_name):
 def api_rebuild_encodings():
     """Rebuild all face encodings"""
     total = rebuild_all_encodings()
+    invalidate_students_cache()
     return jsonify({
         'success': True,
         'message': f'Rebuilt encodings for {total} faces'
@@ -398,19 +760,36 @@ def api_rebuild_encodings():
 
 @app.route('/images/<student_name>/<photo_name>')
 def serve_image(student_name, photo_name):
-    """Serve student images"""
-    return send_from_directory(IMAGES_DIR / student_name, photo_name)
+    """Serve student images (conditional GET with ETag/Last-Modified)
+
+    No max-age: photo names are reused after a delete, so browsers must
+    revalidate rather than keep showing the old image.
+    """
+    return send_from_directory(IMAGES_DIR, f"{student_name}/{photo_name}")
+
+@app.route('/thumbs/<student_name>/<photo_name>')
+def serve_thumbnail(student_name, photo_name):
+    """Serve a small thumbnail of a student image, (re)creating it when missing or older than the photo"""
+    photo_path = safe_join(str(IMAGES_DIR), student_name, photo_name)
+    if photo_path is None or not os.path.isfile(photo_path):
+        return jsonify({'error': 'Photo not found'}), 404
+    
+    thumb_path = Path(photo_path).parent / THUMBS_DIRNAME / photo_name
+    if not thumb_path.exists() or thumb_path.stat().st_mtime < os.path.getmtime(photo_path):
+        make_thumbnail(Path(photo_path))
+    
+    return send_from_directory(IMAGES_DIR, f"{student_name}/{THUMBS_DIRNAME}/{photo_name}")
 
 def generate_frames():
     """Generate video frames with MULTI-STUDENT face recognition"""
-    global camera, known_encodings, known_names, current_session_attendance
+    global camera, current_session_attendance
     
     # Always reinitialize camera for a fresh session
     if camera:
         camera.release()
         cv2.destroyAllWindows()
     
-    camera = cv2.VideoCapture(0)
+    camera = CameraReader(0)
     
     # Small delay to ensure camera is fully initialized
     import time
@@ -423,13 +802,33 @@ def generate_frames():
     today = str(date.today())
     
     # Initialize today's attendance if needed
-    if today not in attendance_records:
-        attendance_records[today] = {}
+    attendance_times.setdefault(today, {})
+    present_today = attendance_sets[today]
     
     # Track confidence for auto-attendance
     attendance_tracking = {}  # {name: frames_seen_count}
     ATTENDANCE_THRESHOLD = 10  # Need to see student for 10 frames to confirm
     
+    # Per-frame working buffers, (re)allocated when the frame size changes
+    frame_shape = None
+    
+    # Pre-rendered overlay panels and the contents they were rendered for
+    info_panel = info_panel_key = None
+    attendance_panel = attendance_panel_key = None
+    
+    # Full detect+encode only every RECOGNIZE_EVERY frames; recognized faces
+    # are followed with lightweight trackers in between
+    RECOGNIZE_EVERY = 5
+    frame_idx = 0
+    face_locations = []
+    trackers = {}  # {face_idx: tracker}
+    has_unknown = False
+    force_recognition = True  # Next usable frame must run a full pass
+    
+    # Dark or unchanged frames skip recognition altogether
+    DARK_THRESHOLD = 60  # Mean brightness (0-255) below which the frame is too dark
+    STILL_THRESHOLD = 2.0  # Mean gray-level change below which a frame counts as unchanged
+    
     try:
         while True:  # Keep streaming, check recognition_active inside loop
             if not recognition_active:
@@ -440,8 +839,7 @@ def generate_frames():
                     cv2.putText(frame, "Recognition Stopped - Click START to begin", 
                                (50, frame.shape[0]//2),
                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                    ret, buffer = cv2.imencode('.jpg', frame)
-                    frame = buffer.tobytes()
+                    frame = encode_jpeg(frame)
                     yield (b'--frame\r\n'
                            b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
                 time.sleep(0.1)  # Reduce CPU usage when stopped
@@ -452,51 +850,109 @@ def generate_frames():
             if not success:
                 break
             
-            # Resize for faster processing
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            # Resize for faster processing, reusing buffers across frames
+            if frame.shape != frame_shape:
+                frame_shape = frame.shape
+                small_shape = (frame_shape[0] // 4, frame_shape[1] // 4, 3)
+                small_frame = np.empty(small_shape, dtype=np.uint8)
+                rgb_small_frame = np.empty(small_shape, dtype=np.uint8)
+                gray_small = np.empty(small_shape[:2], dtype=np.uint8)
+                prev_gray_small = np.empty(small_shape[:2], dtype=np.uint8)
+                gray_diff = np.empty(small_shape[:2], dtype=np.uint8)
+                have_prev_gray = False
+            cv2.resize(frame, (small_shape[1], small_shape[0]), dst=small_frame, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB, dst=rgb_small_frame)
             
-            # Detect ALL faces in frame
-            face_locations = face_recognition.face_locations(rgb_small_frame)
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+            # Check brightness first. Mean luma is scale-invariant, so read it off
+            # the small frame: 1/16 of the pixels already act as a strided sample
+            cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY, dst=gray_small)
+            brightness = cv2.mean(gray_small)[0]
+            too_dark = brightness < DARK_THRESHOLD
             
-            # Check brightness
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            brightness = np.mean(gray)
+            # Near-identical consecutive frames reuse the previous result
+            still = have_prev_gray and cv2.mean(
+                cv2.absdiff(gray_small, prev_gray_small, dst=gray_diff))[0] < STILL_THRESHOLD
+            gray_small, prev_gray_small = prev_gray_small, gray_small
+            have_prev_gray = True
+            
+            if too_dark:
+                # Nothing useful to find - skip detection and encoding entirely
+                face_locations = []
+                recognized = np.zeros(0, dtype=bool)
+                face_names, face_confidences, face_colors = [], [], []
+                trackers = {}
+                has_unknown = False
+                force_recognition = True
+            elif still and not force_recognition:
+                pass
+            # Detect ALL faces in frame (unknown faces are never tracked, so re-detect)
+            elif force_recognition or has_unknown or frame_idx % RECOGNIZE_EVERY == 0:
+                force_recognition = False
+                face_locations = face_recognition.face_locations(
+                    rgb_small_frame, number_of_times_to_upsample=int(SETTINGS['detection_upsample']), model='hog'
+                )
+                # Cheaply prune tiny boxes (mostly false positives) before encoding
+                min_area = SETTINGS['stream_min_face_size'] * small_shape[0] * small_shape[1]
+                face_locations = [loc for loc in face_locations
+                                  if (loc[2] - loc[0]) * (loc[1] - loc[3]) >= min_area]
+                # One gallery snapshot per pass, so indices always match the names
+                gallery = known_gallery
+                known_names = gallery[2]
+                # The ResNet encoding pass is pointless with an empty gallery
+                face_encodings = []
+                if known_names and face_locations:
+                    face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+                
+                # Match every face in the frame against the gallery in one shot
+                if face_encodings:
+                    best_idx, best_d2 = match_faces(face_encodings, gallery)
+                    # Use configurable confidence threshold (compared squared)
+                    recognized = best_d2 <= (1.0 - SETTINGS['confidence_threshold']) ** 2
+                    confidences = np.where(recognized, (1.0 - np.sqrt(best_d2)) * 100, 0.0)
+                else:
+                    best_idx = np.zeros(len(face_locations), dtype=np.int64)
+                    recognized = np.zeros(len(face_locations), dtype=bool)
+                    confidences = np.zeros(len(face_locations))
+                has_unknown = not recognized.all()
+                
+                # Resolve labels for the whole frame at once; tracked frames reuse them
+                face_names = [known_names[i] if ok else "Unknown" for i, ok in zip(best_idx.tolist(), recognized)]
+                face_confidences = confidences.tolist()
+                color_codes = np.select([confidences > 80, confidences > 70], [0, 1], default=2)
+                face_colors = [MATCH_COLORS[c] for c in color_codes.tolist()]
+                
+                trackers = {}
+                for face_idx, (top, right, bottom, left) in enumerate(face_locations):
+                    tracker = create_face_tracker() if recognized[face_idx] else None
+                    if tracker is not None:
+                        tracker.init(small_frame, (left, top, right - left, bottom - top))
+                        trackers[face_idx] = tracker
+            else:
+                face_locations = list(face_locations)
+                for face_idx, tracker in trackers.items():
+                    ok, (x, y, w, h) = tracker.update(small_frame)
+                    if ok:
+                        face_locations[face_idx] = (int(y), int(x + w), int(y + h), int(x))
+            frame_idx += 1
             
             # Draw guidance
             height, width = frame.shape[:2]
             
-            # Info panel at top
-            cv2.rectangle(frame, (0, 0), (width, 80), (0, 0, 0), -1)
-            
-            # Show face count and status
-            face_count_text = f"👥 Faces Detected: {len(face_locations)}"
-            cv2.putText(frame, face_count_text, (20, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-            
-            if brightness < 60:
-                cv2.putText(frame, "⚠️  WARNING: TOO DARK!", (20, 60),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2)
-            elif len(face_locations) == 0:
-                cv2.putText(frame, "❌ No faces detected", (20, 60),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            else:
-                cv2.putText(frame, "✅ Multi-Student Recognition Active", (20, 60),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            # Info panel at top (re-rendered only when its contents change)
+            info_key = (width, len(face_locations), too_dark)
+            if info_key != info_panel_key:
+                info_panel = render_info_panel(width, len(face_locations), too_dark)
+                info_panel_key = info_key
+            frame[:info_panel.shape[0]] = info_panel
             
             # Recognize ALL faces with enhanced features
-            current_time = datetime.now()
+            now = time.monotonic()
             
-            # Update recognition status for sound/voice feedback
+            # Collect recognition status for sound/voice feedback
             global current_recognition_status
-            current_recognition_status['faces_detected'] = []
-            current_recognition_status['no_face'] = len(face_locations) == 0
-            current_recognition_status['too_dark'] = brightness < 60
-            current_recognition_status['brightness'] = float(brightness)
-            current_recognition_status['last_update'] = current_time
+            faces_status = []
             
-            for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
+            for face_idx, (top, right, bottom, left) in enumerate(face_locations):
                 # Scale back up
                 top *= 4
                 right *= 4
@@ -509,68 +965,47 @@ def generate_frames():
                 is_duplicate = False
                 cooldown_remaining = 0
                 
-                if known_encodings:
-                    distances = face_recognition.face_distance(known_encodings, face_encoding)
-                    if len(distances) > 0:
-                        min_idx = distances.argmin()
-                        min_distance = distances[min_idx]
-                        
-                        # Use configurable confidence threshold
-                        threshold = 1.0 - SETTINGS['confidence_threshold']
-                        
-                        if min_distance <= threshold:  # Recognized!
-                            name = known_names[min_idx]
-                            confidence = (1.0 - min_distance) * 100
-                            recognized_today.add(name)
-                            
-                            # Add to status for sound/voice feedback
-                            current_recognition_status['faces_detected'].append({
-                                'name': name,
-                                'confidence': confidence
-                            })
-                            
-                            # 🚫 DUPLICATE DETECTION - Check cooldown period
-                            if name in last_recognition_time:
-                                time_diff = (current_time - last_recognition_time[name]).total_seconds()
-                                if time_diff < SETTINGS['duplicate_cooldown']:
-                                    is_duplicate = True
-                                    cooldown_remaining = int(SETTINGS['duplicate_cooldown'] - time_diff)
-                                    color = (0, 165, 255)  # Orange for duplicate
-                                else:
-                                    last_recognition_time[name] = current_time
-                            else:
-                                last_recognition_time[name] = current_time
-                            
-                            # Track for auto-attendance (only if not duplicate)
-                            if not is_duplicate:
-                                if name not in attendance_tracking:
-                                    attendance_tracking[name] = 0
-                                attendance_tracking[name] += 1
-                                
-                                # AUTO-MARK ATTENDANCE after threshold! 🎯
-                                if attendance_tracking[name] >= ATTENDANCE_THRESHOLD:
-                                    if name not in attendance_records[today]:
-                                        attendance_records[today][name] = current_time.strftime('%H:%M:%S')
-                                        current_session_attendance.add(name)
-                            
-                            # 🎨 Color based on status
-                            if is_duplicate:
-                                color = (0, 165, 255)  # Orange - duplicate warning
-                            elif confidence > 80:
-                                color = (0, 255, 0)  # Bright green - excellent match
-                            elif confidence > 70:
-                                color = (50, 205, 50)  # Lime green - good match
-                            else:
-                                color = (0, 200, 200)  # Cyan - acceptable match
+                if recognized[face_idx]:  # Recognized!
+                    name = face_names[face_idx]
+                    confidence = face_confidences[face_idx]
+                    recognized_today.add(name)
+                    
+                    # Add to status for sound/voice feedback
+                    faces_status.append({
+                        'name': name,
+                        'confidence': confidence
+                    })
+                    
+                    # 🚫 DUPLICATE DETECTION - Check cooldown period
+                    if name in last_recognition_time:
+                        time_diff = now - last_recognition_time[name]
+                        if time_diff < SETTINGS['duplicate_cooldown']:
+                            is_duplicate = True
+                            cooldown_remaining = int(SETTINGS['duplicate_cooldown'] - time_diff)
+                            color = (0, 165, 255)  # Orange for duplicate
                         else:
-                            # Unknown face - add to status
-                            current_recognition_status['faces_detected'].append({
-                                'name': 'Unknown',
-                                'confidence': 0
-                            })
+                            last_recognition_time[name] = now
+                    else:
+                        last_recognition_time[name] = now
+                    
+                    # Track for auto-attendance (only if not duplicate)
+                    if not is_duplicate:
+                        if name not in attendance_tracking:
+                            attendance_tracking[name] = 0
+                        attendance_tracking[name] += 1
+                        
+                        # AUTO-MARK ATTENDANCE after threshold! 🎯
+                        if attendance_tracking[name] >= ATTENDANCE_THRESHOLD:
+                            if name not in present_today:
+                                # Wall-clock time is only needed on this rare path
+                                record_attendance(today, name, datetime.now().strftime('%H:%M:%S'))
+                                current_session_attendance.add(name)
+                    
+                    # 🎨 Color based on status
+                    color = (0, 165, 255) if is_duplicate else face_colors[face_idx]
                 else:
-                    # No encodings loaded - mark as unknown
-                    current_recognition_status['faces_detected'].append({
+                    # Unknown face (or no encodings loaded) - add to status
+                    faces_status.append({
                         'name': 'Unknown',
                         'confidence': 0
                     })
@@ -584,7 +1019,7 @@ def generate_frames():
                 if name != "Unknown":
                     text += f" {confidence:.0f}%"
                     # Add checkmark if confirmed
-                    if name in attendance_records[today]:
+                    if name in present_today:
                         text += " ✓"
                     # Show duplicate warning
                     if is_duplicate:
@@ -635,34 +1070,25 @@ def generate_frames():
                         cv2.putText(frame, welcome_text, (banner_x, banner_y),
                                    cv2.FONT_HERSHEY_DUPLEX, 1.5, (0, 0, 0), 3)
             
+            # Publish this frame's status in one atomic store
+            current_recognition_status = RecognitionStatus(
+                tuple(faces_status), len(face_locations) == 0, too_dark, float(brightness), time.time()
+            )
+            
             # Show attendance panel at bottom
             if recognized_today:
-                # Background panel
-                panel_height = min(200, 30 + len(recognized_today) * 30)
-                cv2.rectangle(frame, (0, height - panel_height), (350, height), (0, 0, 0), -1)
-                
-                y_offset = height - panel_height + 25
-                present_count = len([p for p in recognized_today if p in attendance_records[today]])
-                
-                cv2.putText(frame, f"📋 Attendance: {present_count}/{len(recognized_today)}", (10, y_offset),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                y_offset += 30
-                
-                for person in sorted(recognized_today):
-                    # Show status
-                    if person in attendance_records[today]:
-                        prefix = "✅"
-                        time_str = f" - {attendance_records[today][person]}"
-                        color_code = (0, 255, 0)
-                    else:
-                        progress = attendance_tracking.get(person, 0)
-                        prefix = f"○ {int((progress/ATTENDANCE_THRESHOLD)*100)}%"
-                        time_str = ""
-                        color_code = (255, 255, 0)
-                    
-                    cv2.putText(frame, f"{prefix} {person}{time_str}", (15, y_offset),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, color_code, 1)
-                    y_offset += 28
+                # Rows only change when someone is seen, confirmed or progresses
+                rows = tuple(
+                    (person, attendance_times[today].get(person),
+                     int((attendance_tracking.get(person, 0) / ATTENDANCE_THRESHOLD) * 100))
+                    for person in sorted(recognized_today)
+                )
+                if rows != attendance_panel_key:
+                    attendance_panel = render_attendance_panel(rows)
+                    attendance_panel_key = rows
+                panel_height = min(attendance_panel.shape[0], height)
+                panel_width = min(attendance_panel.shape[1], width)
+                frame[height - panel_height:height, :panel_width] = attendance_panel[:panel_height, :panel_width]
             
             # Show current count in top-right
             present_count = len(current_session_attendance)
@@ -672,8 +1098,7 @@ def generate_frames():
                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
             
             # Encode frame
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
+            frame = encode_jpeg(frame)
             
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
@@ -709,31 +1134,25 @@ def stop_recognition():
     cv2.destroyAllWindows()
     
     # Reset recognition status to clear any ghost data
-    current_recognition_status = {
-        'faces_detected': [],
-        'no_face': False,
-        'unknown_face': False,
-        'timestamp': None
-    }
+    current_recognition_status = RecognitionStatus()
     
     return jsonify({'success': True, 'message': 'Recognition stopped'})
 
 @app.route('/api/recognition/status')
 def get_recognition_status():
     """Get current recognition status for sound/voice feedback"""
-    global current_recognition_status
-    
     if not recognition_active:
         return jsonify({'active': False})
     
-    # Return copy of current status
+    # Read the snapshot reference once; the video loop swaps in a new one
+    snapshot = current_recognition_status
     status = {
         'active': True,
-        'faces_detected': current_recognition_status.get('faces_detected', []),
-        'no_face': bool(current_recognition_status.get('no_face', False)),
-        'too_dark': bool(current_recognition_status.get('too_dark', False)),
-        'brightness': float(current_recognition_status.get('brightness', 0)),
-        'last_update': current_recognition_status.get('last_update').isoformat() if current_recognition_status.get('last_update') else None
+        'faces_detected': list(snapshot.faces_detected),
+        'no_face': bool(snapshot.no_face),
+        'too_dark': bool(snapshot.too_dark),
+        'brightness': float(snapshot.brightness),
+        'last_update': datetime.fromtimestamp(snapshot.last_update).isoformat() if snapshot.last_update else None
     }
     
     return jsonify(status)
@@ -742,14 +1161,15 @@ def get_recognition_status():
 def get_today_attendance():
     """Get today's attendance"""
     today = str(date.today())
-    attendance = attendance_records.get(today, {})
+    attendance = attendance_times.get(today, {})
+    present_set = attendance_sets.get(today, set())
     
     # Get all students
     all_students = [s['name'] for s in get_all_students()]
     
     # Mark who's present and absent
     present = list(attendance.keys())
-    absent = [s for s in all_students if s not in present]
+    absent = [s for s in all_students if s not in present_set]
     
     return jsonify({
         'date': today,
@@ -772,16 +1192,14 @@ def mark_attendance():
     
     today = str(date.today())
     
-    if today not in attendance_records:
-        attendance_records[today] = {}
-    
-    attendance_records[today][student_name] = datetime.now().strftime('%H:%M:%S')
+    time_str = datetime.now().strftime('%H:%M:%S')
+    record_attendance(today, student_name, time_str)
     current_session_attendance.add(student_name)
     
     return jsonify({
         'success': True,
         'message': f'{student_name} marked present',
-        'time': attendance_records[today][student_name]
+        'time': time_str
     })
 
 @app.route('/api/attendance/unmark', methods=['POST'])
@@ -795,8 +1213,8 @@ def unmark_attendance():
     
     today = str(date.today())
     
-    if today in attendance_records and student_name in attendance_records[today]:
-        del attendance_records[today][student_name]
+    if student_name in attendance_sets.get(today, ()):
+        remove_attendance(today, student_name)
         current_session_attendance.discard(student_name)
     
     return jsonify({
@@ -809,8 +1227,9 @@ def clear_today_attendance():
     """Clear today's attendance"""
     today = str(date.today())
     
-    if today in attendance_records:
-        del attendance_records[today]
+    # Empty in place - a running video stream holds today's set
+    attendance_times.get(today, {}).clear()
+    attendance_sets[today].clear()
     
     current_session_attendance.clear()
     
@@ -823,29 +1242,35 @@ def clear_today_attendance():
 def get_attendance_history():
     """Get attendance history"""
     return jsonify({
-        'records': attendance_records,
-        'total_days': len(attendance_records)
+        'records': attendance_times,
+        'total_days': len(attendance_times)
     })
 
 @app.route('/api/attendance/export')
 def export_attendance():
-    """Export attendance as CSV-like data"""
-    all_students = [s['name'] for s in get_all_students()]
-    dates = sorted(attendance_records.keys())
+    """Export attendance as NDJSON: a header line, then one line per student
     
-    # Build export data
-    export_data = {
-        'students': all_students,
-        'dates': dates,
-        'attendance': {}
-    }
-    
-    for student in all_students:
-        export_data['attendance'][student] = {}
-        for date_str in dates:
-            export_data['attendance'][student][date_str] = student in attendance_records.get(date_str, {})
-    
-    return jsonify(export_data)
+    Header: {"students": [...], "dates": [...]}
+    Rows:   {"name": ..., "present": [bool per date]}
+    """
+    all_students = [s['name'] for s in get_all_students()]
+    dates = sorted(attendance_times.keys())
+    
+    # Date positions each student was present on; only recorded entries are visited
+    present_days = defaultdict(list)
+    for i, date_str in enumerate(dates):
+        for student in attendance_sets.get(date_str, ()):
+            present_days[student].append(i)
+    
+    def generate():
+        yield app.json.dumps({'students': all_students, 'dates': dates}) + '\n'
+        for student in all_students:
+            row = [False] * len(dates)
+            for i in present_days.get(student, ()):
+                row[i] = True
+            yield app.json.dumps({'name': student, 'present': row}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
@@ -869,10 +1294,9 @@ def update_settings():
 @app.route('/api/search/students/<query>')
 def search_students(query):
     """Search students by name"""
-    all_students = get_all_students()
     query_lower = query.lower()
     
-    results = [s for s in all_students if query_lower in s['name'].lower()]
+    results = [s for s, name_lower in get_students_with_lower_names() if query_lower in name_lower]
     
     return jsonify({
         'results': results,
@@ -882,14 +1306,16 @@ def search_students(query):
 @app.route('/api/stats')
 def get_stats():
     """Get system statistics"""
-    students = get_all_students()
-    total_photos = sum(s['image_count'] for s in students)
+    # Totals are computed once per student-cache fill, not per poll
+    cache = get_students_cache()
+    students = cache['students']
+    total_photos = cache['total_photos']
     
     today = str(date.today())
-    present_today = len(attendance_records.get(today, {}))
+    present_today = len(attendance_sets.get(today, ()))
     
     # Load encodings count
-    encodings_count = len(known_encodings) if known_encodings else 0
+    encodings_count = len(known_gallery[0])
     
     return jsonify({
         'total_students': len(students),
@@ -901,7 +1327,13 @@ def get_stats():
     })
 
 if __name__ == '__main__':
-    import os
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Face recognition web dashboard")
+    parser.add_argument("--dev", action="store_true",
+                        help="Use Flask's debug server with the reloader instead of waitress")
+    args = parser.parse_args()
+    dev_mode = args.dev or os.environ.get('FLASK_ENV') == 'development'
     
     print("\n" + "="*60)
     print("🎓 FACE RECOGNITION WEB DASHBOARD")
@@ -915,10 +1347,21 @@ if __name__ == '__main__':
     print("   ✅ Real-time guidance")
     print("\n" + "="*60 + "\n")
     
-    # Load initial encodings
+    # Load initial encodings and warm up dlib before the first stream frame
     load_encodings()
+    warm_up_models()
     
     # Get port from environment variable (for deployment) or use 5001
     port = int(os.environ.get('PORT', 5001))
     
-    app.run(debug=True, host='0.0.0.0', port=port, threaded=True)
+    if dev_mode:
+        app.run(debug=True, host='0.0.0.0', port=port, threaded=True)
+    else:
+        try:
+            from waitress import serve
+        except ImportError:
+            print("⚠️  waitress not installed (pip install waitress) - using Flask's server")
+            app.run(host='0.0.0.0', port=port, threaded=True)
+        else:
+            # Each MJPEG /video_feed client holds a thread for as long as it watches
+            serve(app, host='0.0.0.0', port=port, threads=8)
@@ -14,14 +14,24 @@ Or use the shell script:
 """
 
 import cv2
+import math
+import os
 import sys
+import atexit
+import signal
+import queue
+import threading
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 from pathlib import Path
 
 try:
     import face_recognition
     import numpy as np
+    from utils import (ENCODING_DIM, QUANTIZE_MIN_ROWS, capture_frames, create_face_tracker,
+                       detect_and_encode, nearest_encoding, nearest_encoding_int8,
+                       quantize_encodings, warm_up_matchers)
     print("✓ All libraries loaded successfully")
 except ImportError as e:
     print(f"Error: Could not import required library: {e}")
@@ -31,52 +41,130 @@ except ImportError as e:
 
 # Simple attendance tracking (file-based)
 ATTENDANCE_FILE = Path("attendance_log.txt")
+# (date_iso, name) -> time for every line in ATTENDANCE_FILE; see load_attendance_marks()
+attendance_marks = {}
+
+# Log lines waiting to be appended; flushed every LOG_FLUSH_INTERVAL seconds,
+# once LOG_FLUSH_MAX lines are queued, and at exit
+LOG_FLUSH_INTERVAL = 1.0
+LOG_FLUSH_MAX = 64
+_log_buf = []
+_log_lock = threading.Lock()
+_flush_lock = threading.Lock()  # keeps concurrent flushes (flusher thread, atexit) in order
+_log_wakeup = threading.Event()
+
+# Faces are detected on a frame shrunk by this factor, then boxes are scaled back
+DETECT_DOWNSCALE = 2
+
+# Full detection + recognition runs every RECOGNIZE_EVERY frames; the frames
+# in between only update a tracker on the last matched face
+RECOGNIZE_EVERY = 5
 
 
 def load_pickle_encodings():
-    """Load encodings from the pickle file used by your dashboard"""
+    """Load encodings saved by your dashboard as an (N, 128) float32 matrix and names
+    
+    Reads encodings/known_faces.npz when it is at least as new as the pickle;
+    otherwise loads the pickle and writes the .npz for next time.
+    """
     encodings_file = Path("encodings/known_faces.pkl")
+    npz_file = encodings_file.with_suffix('.npz')
+    
+    if npz_file.exists() and (not encodings_file.exists()
+                              or npz_file.stat().st_mtime >= encodings_file.stat().st_mtime):
+        try:
+            with np.load(npz_file) as data:
+                encodings = np.ascontiguousarray(data['enc'], dtype=np.float32)
+                names = [str(name) for name in data['names']]
+            print(f"✓ Loaded {len(encodings)} student encodings from {npz_file}")
+            return encodings, names
+        except Exception as e:
+            print(f"⚠️  Could not read {npz_file} ({e}), trying the pickle")
     
     if not encodings_file.exists():
         print(f"❌ Encodings file not found: {encodings_file}")
         print("Please run the dashboard first to generate encodings, or run:")
         print("  python encode_faces.py")
-        return [], []
+        return np.empty((0, 128), np.float32), []
     
     try:
         with open(encodings_file, 'rb') as f:
             data = pickle.load(f)
             encodings = data.get('encodings', [])
             names = data.get('names', [])
-            
+        
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
         print(f"✓ Loaded {len(encodings)} student encodings from {encodings_file}")
+        
+        # Same layout the dashboard writes, so later runs skip the unpickle
+        try:
+            np.savez_compressed(npz_file, enc=encodings, names=np.asarray(names, dtype=str))
+        except OSError as e:
+            print(f"⚠️  Could not write {npz_file}: {e}")
         return encodings, names
     
     except Exception as e:
         print(f"❌ Error loading encodings: {e}")
-        return [], []
+        return np.empty((0, 128), np.float32), []
+
+
+def load_attendance_marks():
+    """Read the attendance log once into {(date_iso, name): time} for duplicate checks"""
+    attendance_marks.clear()
+    if ATTENDANCE_FILE.exists():
+        with open(ATTENDANCE_FILE, 'r') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('|', 2)
+                if len(parts) == 3:
+                    attendance_marks[(parts[0], parts[1])] = parts[2].strip()
+
+
+def flush_attendance_log():
+    """Append all queued attendance lines with one write and one fsync"""
+    global _log_buf
+    # Writers queue behind _flush_lock only; the recognition loop's
+    # _log_lock is held just long enough to swap the buffer out
+    with _flush_lock:
+        with _log_lock:
+            buf, _log_buf = _log_buf, []
+        if buf:
+            with open(ATTENDANCE_FILE, 'a') as f:
+                f.writelines(buf)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _attendance_log_flusher():
+    """Background thread: flush the log queue periodically or when it fills up"""
+    while True:
+        _log_wakeup.wait(LOG_FLUSH_INTERVAL)
+        _log_wakeup.clear()
+        try:
+            flush_attendance_log()
+        except OSError as e:
+            print(f"❌ Could not write {ATTENDANCE_FILE}: {e}")
 
 
 def mark_attendance_to_file(student_name):
     """Mark student attendance in a text file"""
     today = date.today()
     now = datetime.now()
+    key = (today.isoformat(), student_name)
     
     # Check if already marked today
-    if ATTENDANCE_FILE.exists():
-        with open(ATTENDANCE_FILE, 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                if today.isoformat() in line and student_name in line:
-                    timestamp = line.split('|')[2].strip()
-                    print(f"⚠️  {student_name} already marked present today at {timestamp}")
-                    return False
+    if key in attendance_marks:
+        print(f"⚠️  {student_name} already marked present today at {attendance_marks[key]}")
+        return False
     
     # Write new attendance record
-    record = f"{today.isoformat()}|{student_name}|{now.strftime('%H:%M:%S')}\n"
+    timestamp = now.strftime('%H:%M:%S')
+    record = f"{today.isoformat()}|{student_name}|{timestamp}\n"
     
-    with open(ATTENDANCE_FILE, 'a') as f:
-        f.write(record)
+    with _log_lock:
+        _log_buf.append(record)
+        if len(_log_buf) >= LOG_FLUSH_MAX:
+            _log_wakeup.set()
+    attendance_marks[key] = timestamp
     
     print(f"✓ ATTENDANCE VERIFIED: {student_name}")
     print(f"  Date: {today}")
@@ -95,13 +183,32 @@ def main():
     # Load student encodings from pickle file
     known_encodings, known_names = load_pickle_encodings()
     
-    if not known_encodings:
+    if len(known_encodings) == 0:
         print("\n❌ No students found!")
         print("Please add students using the web dashboard first,")
         print("or run: python encode_faces.py")
         return
     
     print(f"\nStudents loaded: {', '.join(set(known_names))}")
+    load_attendance_marks()
+    
+    # Write attendance lines in batches; make sure the last ones land on exit
+    threading.Thread(target=_attendance_log_flusher, daemon=True).start()
+    atexit.register(flush_attendance_log)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # Encodings arrive as one contiguous (N, 128) float32 matrix; precompute
+    # halved squared norms so each frame is a single matrix-vector product
+    known_matrix = known_encodings
+    known_half_norm_sq = 0.5 * (known_matrix * known_matrix).sum(axis=1)
+    # The Numba kernels read exactly ENCODING_DIM columns per row
+    assert known_matrix.shape[1] == ENCODING_DIM
+    warm_up_matchers()
+    
+    # Large galleries are scanned as int8 codes with a per-row scale
+    use_int8 = nearest_encoding_int8 is not None and len(known_matrix) >= QUANTIZE_MIN_ROWS
+    if use_int8:
+        known_codes, known_scales, known_code_norm_sq = quantize_encodings(known_matrix)
     
     # Initialize camera
     print("\nInitializing camera...")
@@ -121,107 +228,152 @@ def main():
     TOLERANCE = 0.6
     CONFIDENCE_THRESHOLD = 70
     FRAMES_REQUIRED = 5
+    # A gallery row this close passes the tolerance and confidence checks, so the scan can stop there
+    accept_sq = min(TOLERANCE, 1.0 - CONFIDENCE_THRESHOLD / 100) ** 2
     
     # Tracking variables
     current_person = None
     frame_count = 0
     attendance_verified = False
+    tracker = None
+    frame_idx = 0
+    
+    # dlib runs on its own thread so the UI loop stays live during detection
+    detector_pool = ThreadPoolExecutor(max_workers=1)
+    
+    # Grab frames on a background thread; the loop below always gets the newest one
+    frames = queue.Queue(maxsize=1)
+    stop_event = threading.Event()
+    reader = threading.Thread(target=capture_frames, args=(cap, frames, stop_event), daemon=True)
+    reader.start()
     
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            frame = frames.get()
+            if frame is None:
                 print("❌ Could not read frame from camera")
                 break
             
-            # Convert to RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame_idx += 1
+            matched = False
             
-            # Detect faces
-            face_locations = face_recognition.face_locations(rgb_frame)
+            # Between full recognitions, follow the matched face with the tracker
+            if tracker is not None and frame_idx % RECOGNIZE_EVERY != 0:
+                ok, box = tracker.update(frame)
+                if ok:
+                    x, y, w, h = (int(v) for v in box)
+                    top, right, bottom, left = y, x + w, y + h, x
+                    name = current_person  # confidence is kept from the last match
+                    matched = True
             
-            if not face_locations:
-                # No face detected
-                if current_person is not None:
-                    frame_count = 0
-                    current_person = None
+            if not matched:
+                tracker = None
                 
-                cv2.putText(frame, "No face detected", (10, 30),
-                           cv2.FONT_HERSHEY_DUPLEX, 0.8, (0, 0, 255), 2)
-                cv2.imshow('Attendance Check', frame)
+                # Detect on a downscaled RGB copy - HOG cost scales with pixel count
+                small_frame = cv2.resize(frame, (0, 0), fx=1 / DETECT_DOWNSCALE, fy=1 / DETECT_DOWNSCALE)
+                rgb_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
                 
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                # Detect and encode on the worker thread; dlib releases the GIL,
+                # so keep the window's event loop running meanwhile
+                detect_future = detector_pool.submit(detect_and_encode, rgb_small)
+                quit_requested = False
+                while not detect_future.done():
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        quit_requested = True
+                if quit_requested:
+                    print("\n⚠️  Manually quit - no attendance marked")
                     break
-                continue
-            
-            # Get face encodings
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-            
-            if face_encodings:
-                face_encoding = face_encodings[0]
-                top, right, bottom, left = face_locations[0]
+                face_locations, face_encodings = detect_future.result()
                 
-                # Compare with known faces
-                distances = face_recognition.face_distance(known_encodings, face_encoding)
+                if not face_locations:
+                    # No face detected
+                    if current_person is not None:
+                        frame_count = 0
+                        current_person = None
+                    
+                    cv2.putText(frame, "No face detected", (10, 30),
+                               cv2.FONT_HERSHEY_DUPLEX, 0.8, (0, 0, 255), 2)
+                    cv2.imshow('Attendance Check', frame)
+                    
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                    continue
                 
-                if len(distances) > 0:
-                    min_idx = np.argmin(distances)
-                    min_distance = distances[min_idx]
+                if face_encodings:
+                    face_encoding = face_encodings[0]
+                    top, right, bottom, left = (v * DETECT_DOWNSCALE for v in face_locations[0])
+                    
+                    # Compare with known faces
+                    q = face_encoding.astype(np.float32)
+                    if use_int8:
+                        min_idx, min_d2 = nearest_encoding_int8(known_codes, known_scales, known_code_norm_sq,
+                                                                q, accept_sq)
+                    else:
+                        min_idx, min_d2 = nearest_encoding(known_matrix, q, accept_sq, known_half_norm_sq)
                     
-                    if min_distance <= TOLERANCE:
-                        # Match found
-                        name = known_names[min_idx]
-                        confidence = (1.0 - min_distance) * 100
+                    if min_idx >= 0:
+                        min_distance = math.sqrt(min_d2)
                         
-                        if confidence >= CONFIDENCE_THRESHOLD:
-                            # Check if same person
-                            if current_person == name:
-                                frame_count += 1
-                            else:
-                                current_person = name
-                                frame_count = 1
-                            
-                            # Draw green box
-                            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 3)
+                        if min_distance <= TOLERANCE:
+                            # Match found
+                            name = known_names[min_idx]
+                            confidence = (1.0 - min_distance) * 100
                             
-                            # Display name and confidence
-                            text = f"{name} - {confidence:.1f}%"
-                            cv2.putText(frame, text, (left, top - 10),
-                                       cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 0), 2)
-                            
-                            # Display progress
-                            progress = f"Verifying... {frame_count}/{FRAMES_REQUIRED}"
-                            cv2.putText(frame, progress, (10, frame.shape[0] - 20),
-                                       cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 255), 2)
-                            
-                            # Check if verified
-                            if frame_count >= FRAMES_REQUIRED:
-                                # Mark attendance
-                                success = mark_attendance_to_file(name)
-                                
-                                # Display verification message
-                                cv2.rectangle(frame, (0, 0), (frame.shape[1], 100), (0, 255, 0), -1)
-                                cv2.putText(frame, "ATTENDANCE VERIFIED!", (50, 60),
-                                           cv2.FONT_HERSHEY_DUPLEX, 1.2, (255, 255, 255), 3)
-                                cv2.imshow('Attendance Check', frame)
-                                cv2.waitKey(2000)  # Show for 2 seconds
+                            if confidence >= CONFIDENCE_THRESHOLD:
+                                matched = True
+                                if current_person != name:
+                                    current_person = name
+                                    frame_count = 0
                                 
-                                attendance_verified = True
-                                break  # ✅ EXIT AFTER VERIFICATION
+                                # Follow this face cheaply until the next full recognition
+                                tracker = create_face_tracker()
+                                if tracker is not None:
+                                    tracker.init(frame, (left, top, right - left, bottom - top))
+                            else:
+                                # Low confidence
+                                cv2.rectangle(frame, (left, top), (right, bottom), (0, 165, 255), 2)
+                                cv2.putText(frame, f"Low confidence: {confidence:.1f}%", (left, top - 10),
+                                           cv2.FONT_HERSHEY_DUPLEX, 0.6, (0, 165, 255), 2)
+                                frame_count = 0
+                                current_person = None
                         else:
-                            # Low confidence
-                            cv2.rectangle(frame, (left, top), (right, bottom), (0, 165, 255), 2)
-                            cv2.putText(frame, f"Low confidence: {confidence:.1f}%", (left, top - 10),
-                                       cv2.FONT_HERSHEY_DUPLEX, 0.6, (0, 165, 255), 2)
+                            # Unknown face
+                            cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
+                            cv2.putText(frame, "Unknown", (left, top - 10),
+                                       cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 0, 255), 2)
                             frame_count = 0
                             current_person = None
-                    else:
-                        # Unknown face
-                        cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
-                        cv2.putText(frame, "Unknown", (left, top - 10),
-                                   cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 0, 255), 2)
-                        frame_count = 0
-                        current_person = None
+            
+            if matched:
+                frame_count += 1
+                
+                # Draw green box
+                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 3)
+                
+                # Display name and confidence
+                text = f"{name} - {confidence:.1f}%"
+                cv2.putText(frame, text, (left, top - 10),
+                           cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 0), 2)
+                
+                # Display progress
+                progress = f"Verifying... {frame_count}/{FRAMES_REQUIRED}"
+                cv2.putText(frame, progress, (10, frame.shape[0] - 20),
+                           cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 255), 2)
+                
+                # Check if verified
+                if frame_count >= FRAMES_REQUIRED:
+                    # Mark attendance
+                    success = mark_attendance_to_file(name)
+                    
+                    # Display verification message
+                    cv2.rectangle(frame, (0, 0), (frame.shape[1], 100), (0, 255, 0), -1)
+                    cv2.putText(frame, "ATTENDANCE VERIFIED!", (50, 60),
+                               cv2.FONT_HERSHEY_DUPLEX, 1.2, (255, 255, 255), 3)
+                    cv2.imshow('Attendance Check', frame)
+                    cv2.waitKey(2000)  # Show for 2 seconds
+                    
+                    attendance_verified = True
+                    break  # ✅ EXIT AFTER VERIFICATION
             
             # Display frame
             cv2.imshow('Attendance Check', frame)
@@ -236,8 +388,12 @@ def main():
     
     finally:
         # Clean up
+        stop_event.set()
+        reader.join(timeout=1.0)
         cap.release()
         cv2.destroyAllWindows()  # ✅ CLOSE ALL WINDOWS
+        detector_pool.shutdown(wait=True)
+        flush_attendance_log()
         
         if attendance_verified:
             print("\n" + "=" * 60)
@@ -16,14 +16,21 @@ Controls:
 """
 
 import cv2
+import math
 import sys
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 from pathlib import Path
 
 try:
     import face_recognition
     import numpy as np
+    from utils import (ENCODING_DIM, QUANTIZE_MIN_ROWS, as_encoding_matrix, capture_frames,
+                       create_face_tracker, detect_and_encode, nearest_encoding,
+                       nearest_encoding_int8, quantize_encodings, warm_up_matchers)
     from sqlalchemy.orm import Session
     from database import get_engine, get_session_maker, init_db, Student, AttendancePresent
     print("✓ All libraries loaded successfully")
@@ -33,6 +40,14 @@ except ImportError as e:
     sys.exit(1)
 
 
+# Faces are detected on a frame shrunk by this factor, then boxes are scaled back
+DETECT_DOWNSCALE = 2
+
+# Full detection + recognition runs every RECOGNIZE_EVERY frames; the frames
+# in between only update a tracker on the last matched face
+RECOGNIZE_EVERY = 5
+
+
 def load_student_encodings(session: Session):
     """Load all student encodings from database"""
     students = session.query(Student).all()
@@ -82,6 +97,20 @@ def mark_attendance(session: Session, student_id: int, student_name: str):
     return True
 
 
+def mark_attendance_in_new_session(session_maker, student_id: int, student_name: str):
+    """Run mark_attendance with its own session (for the background DB worker)"""
+    with session_maker() as session:
+        return mark_attendance(session, student_id, student_name)
+
+
+def load_marked_today(session: Session):
+    """IDs of students already marked present today"""
+    rows = session.query(AttendancePresent.student_id).filter(
+        AttendancePresent.date == date.today()
+    ).all()
+    return {row.student_id for row in rows}
+
+
 def main():
     """Main function for quick attendance check"""
     print("=" * 60)
@@ -99,12 +128,26 @@ def main():
     # Load student encodings
     with SessionMaker() as session:
         known_encodings, known_names, known_ids = load_student_encodings(session)
+        marked_today = load_marked_today(session)
     
     if not known_encodings:
         print("\n❌ No students found in database!")
         print("Please register students first.")
         return
     
+    # Pack encodings into one contiguous (N, 128) float32 matrix with
+    # precomputed halved squared norms so each frame is a single matrix-vector product
+    known_matrix = as_encoding_matrix(known_encodings)
+    known_half_norm_sq = 0.5 * (known_matrix * known_matrix).sum(axis=1)
+    # The Numba kernels read exactly ENCODING_DIM columns per row
+    assert known_matrix.shape[1] == ENCODING_DIM
+    warm_up_matchers()
+    
+    # Large galleries are scanned as int8 codes with a per-row scale
+    use_int8 = nearest_encoding_int8 is not None and len(known_matrix) >= QUANTIZE_MIN_ROWS
+    if use_int8:
+        known_codes, known_scales, known_code_norm_sq = quantize_encodings(known_matrix)
+    
     # Initialize camera
     print("\nInitializing camera...")
     cap = cv2.VideoCapture(0)
@@ -122,122 +165,173 @@ def main():
     TOLERANCE = 0.6  # Face matching tolerance (lower = stricter)
     CONFIDENCE_THRESHOLD = 70  # Minimum confidence % to verify
     FRAMES_REQUIRED = 5  # Number of consecutive frames needed for verification
+    # A gallery row this close passes the tolerance and confidence checks, so the scan can stop there
+    accept_sq = min(TOLERANCE, 1.0 - CONFIDENCE_THRESHOLD / 100) ** 2
     
     # Tracking variables
     current_person = None
     frame_count = 0
     attendance_verified = False
+    tracker = None
+    frame_idx = 0
+    
+    # Single worker so the DB commit never blocks the UI thread
+    db_executor = ThreadPoolExecutor(max_workers=1)
+    
+    # dlib runs on its own thread so the UI loop stays live during detection
+    detector_pool = ThreadPoolExecutor(max_workers=1)
+    
+    # Grab frames on a background thread; the loop below always gets the newest one
+    frames = queue.Queue(maxsize=1)
+    stop_event = threading.Event()
+    reader = threading.Thread(target=capture_frames, args=(cap, frames, stop_event), daemon=True)
+    reader.start()
     
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            frame = frames.get()
+            if frame is None:
                 print("❌ Could not read frame from camera")
                 break
             
-            # Convert to RGB for face_recognition
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame_idx += 1
+            matched = False
             
-            # Detect faces
-            face_locations = face_recognition.face_locations(rgb_frame)
+            # Between full recognitions, follow the matched face with the tracker
+            if tracker is not None and frame_idx % RECOGNIZE_EVERY != 0:
+                ok, box = tracker.update(frame)
+                if ok:
+                    x, y, w, h = (int(v) for v in box)
+                    top, right, bottom, left = y, x + w, y + h, x
+                    name = current_person  # confidence is kept from the last match
+                    matched = True
             
-            if not face_locations:
-                # No face detected - reset counter
-                if current_person is not None:
-                    frame_count = 0
-                    current_person = None
+            if not matched:
+                tracker = None
                 
-                # Display status
-                cv2.putText(frame, "No face detected", (10, 30),
-                           cv2.FONT_HERSHEY_DUPLEX, 0.8, (0, 0, 255), 2)
-                cv2.imshow('Attendance Check', frame)
+                # Detect on a downscaled RGB copy - HOG cost scales with pixel count
+                small_frame = cv2.resize(frame, (0, 0), fx=1 / DETECT_DOWNSCALE, fy=1 / DETECT_DOWNSCALE)
+                rgb_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
                 
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                # Detect and encode on the worker thread; dlib releases the GIL,
+                # so keep the window's event loop running meanwhile
+                detect_future = detector_pool.submit(detect_and_encode, rgb_small)
+                quit_requested = False
+                while not detect_future.done():
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        quit_requested = True
+                if quit_requested:
+                    print("\n⚠️  Manually quit - no attendance marked")
                     break
-                continue
-            
-            # Get face encodings
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-            
-            # Process first face only
-            if face_encodings:
-                face_encoding = face_encodings[0]
-                top, right, bottom, left = face_locations[0]
+                face_locations, face_encodings = detect_future.result()
                 
-                # Compare with known faces
-                distances = face_recognition.face_distance(known_encodings, face_encoding)
+                if not face_locations:
+                    # No face detected - reset counter
+                    if current_person is not None:
+                        frame_count = 0
+                        current_person = None
+                    
+                    # Display status
+                    cv2.putText(frame, "No face detected", (10, 30),
+                               cv2.FONT_HERSHEY_DUPLEX, 0.8, (0, 0, 255), 2)
+                    cv2.imshow('Attendance Check', frame)
+                    
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                    continue
                 
-                if len(distances) > 0:
-                    min_idx = np.argmin(distances)
-                    min_distance = distances[min_idx]
+                # Process first face only
+                if face_encodings:
+                    face_encoding = face_encodings[0]
+                    top, right, bottom, left = (v * DETECT_DOWNSCALE for v in face_locations[0])
                     
-                    if min_distance <= TOLERANCE:
-                        # Match found!
-                        name = known_names[min_idx]
-                        student_id = known_ids[min_idx]
-                        confidence = (1.0 - min_distance) * 100
+                    # Compare with known faces
+                    q = face_encoding.astype(np.float32)
+                    if use_int8:
+                        min_idx, min_d2 = nearest_encoding_int8(known_codes, known_scales, known_code_norm_sq,
+                                                                q, accept_sq)
+                    else:
+                        min_idx, min_d2 = nearest_encoding(known_matrix, q, accept_sq, known_half_norm_sq)
+                    
+                    if min_idx >= 0:
+                        min_distance = math.sqrt(min_d2)
                         
-                        if confidence >= CONFIDENCE_THRESHOLD:
-                            # Check if same person
-                            if current_person == name:
-                                frame_count += 1
-                            else:
-                                current_person = name
-                                frame_count = 1
-                            
-                            # Draw green box
-                            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 3)
-                            
-                            # Display name and confidence
-                            text = f"{name} - {confidence:.1f}%"
-                            cv2.putText(frame, text, (left, top - 10),
-                                       cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 0), 2)
+                        if min_distance <= TOLERANCE:
+                            # Match found!
+                            name = known_names[min_idx]
+                            student_id = known_ids[min_idx]
+                            confidence = (1.0 - min_distance) * 100
                             
-                            # Display progress
-                            progress = f"Verifying... {frame_count}/{FRAMES_REQUIRED}"
-                            cv2.putText(frame, progress, (10, frame.shape[0] - 20),
-                                       cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 255), 2)
-                            
-                            # Check if verified
-                            if frame_count >= FRAMES_REQUIRED:
-                                # Mark attendance in database
-                                with SessionMaker() as session:
-                                    success = mark_attendance(session, student_id, name)
+                            if confidence >= CONFIDENCE_THRESHOLD:
+                                matched = True
+                                if current_person != name:
+                                    current_person = name
+                                    frame_count = 0
                                 
-                                if success:
-                                    # Display verification message
-                                    cv2.rectangle(frame, (0, 0), (frame.shape[1], 100), (0, 255, 0), -1)
-                                    cv2.putText(frame, "ATTENDANCE VERIFIED!", (50, 60),
-                                               cv2.FONT_HERSHEY_DUPLEX, 1.2, (255, 255, 255), 3)
-                                    cv2.imshow('Attendance Check', frame)
-                                    cv2.waitKey(2000)  # Show for 2 seconds
-                                    
-                                    attendance_verified = True
-                                    break  # ✅ EXIT AFTER SUCCESSFUL VERIFICATION
-                                else:
-                                    # Already marked - show message and continue
-                                    cv2.rectangle(frame, (0, 0), (frame.shape[1], 100), (0, 165, 255), -1)
-                                    cv2.putText(frame, "Already marked today", (50, 60),
-                                               cv2.FONT_HERSHEY_DUPLEX, 1.0, (255, 255, 255), 2)
-                                    cv2.imshow('Attendance Check', frame)
-                                    cv2.waitKey(2000)
-                                    
-                                    attendance_verified = True
-                                    break  # ✅ EXIT AFTER DUPLICATE CHECK
+                                # Follow this face cheaply until the next full recognition
+                                tracker = create_face_tracker()
+                                if tracker is not None:
+                                    tracker.init(frame, (left, top, right - left, bottom - top))
+                            else:
+                                # Low confidence
+                                cv2.rectangle(frame, (left, top), (right, bottom), (0, 165, 255), 2)
+                                cv2.putText(frame, f"Low confidence: {confidence:.1f}%", (left, top - 10),
+                                           cv2.FONT_HERSHEY_DUPLEX, 0.6, (0, 165, 255), 2)
+                                frame_count = 0
+                                current_person = None
                         else:
-                            # Low confidence
-                            cv2.rectangle(frame, (left, top), (right, bottom), (0, 165, 255), 2)
-                            cv2.putText(frame, f"Low confidence: {confidence:.1f}%", (left, top - 10),
-                                       cv2.FONT_HERSHEY_DUPLEX, 0.6, (0, 165, 255), 2)
+                            # Unknown face
+                            cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
+                            cv2.putText(frame, "Unknown", (left, top - 10),
+                                       cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 0, 255), 2)
                             frame_count = 0
                             current_person = None
+            
+            if matched:
+                frame_count += 1
+                
+                # Draw green box
+                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 3)
+                
+                # Display name and confidence
+                text = f"{name} - {confidence:.1f}%"
+                cv2.putText(frame, text, (left, top - 10),
+                           cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 0), 2)
+                
+                # Display progress
+                progress = f"Verifying... {frame_count}/{FRAMES_REQUIRED}"
+                cv2.putText(frame, progress, (10, frame.shape[0] - 20),
+                           cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 255, 255), 2)
+                
+                # Check if verified
+                if frame_count >= FRAMES_REQUIRED:
+                    # Commit in the background while the banner is on screen;
+                    # today's marks were loaded at startup to pick the banner
+                    mark_future = db_executor.submit(mark_attendance_in_new_session,
+                                                     SessionMaker, student_id, name)
+                    
+                    if student_id not in marked_today:
+                        # Display verification message
+                        cv2.rectangle(frame, (0, 0), (frame.shape[1], 100), (0, 255, 0), -1)
+                        cv2.putText(frame, "ATTENDANCE VERIFIED!", (50, 60),
+                                   cv2.FONT_HERSHEY_DUPLEX, 1.2, (255, 255, 255), 3)
+                        cv2.imshow('Attendance Check', frame)
+                        cv2.waitKey(2000)  # Show for 2 seconds
+                        mark_future.result()
+                        
+                        attendance_verified = True
+                        break  # ✅ EXIT AFTER SUCCESSFUL VERIFICATION
                     else:
-                        # Unknown face
-                        cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
-                        cv2.putText(frame, "Unknown", (left, top - 10),
-                                   cv2.FONT_HERSHEY_DUPLEX, 0.7, (0, 0, 255), 2)
-                        frame_count = 0
-                        current_person = None
+                        # Already marked - show message and continue
+                        cv2.rectangle(frame, (0, 0), (frame.shape[1], 100), (0, 165, 255), -1)
+                        cv2.putText(frame, "Already marked today", (50, 60),
+                                   cv2.FONT_HERSHEY_DUPLEX, 1.0, (255, 255, 255), 2)
+                        cv2.imshow('Attendance Check', frame)
+                        cv2.waitKey(2000)
+                        mark_future.result()
+                        
+                        attendance_verified = True
+                        break  # ✅ EXIT AFTER DUPLICATE CHECK
             
             # Display frame
             cv2.imshow('Attendance Check', frame)
@@ -252,8 +346,12 @@ def main():
     
     finally:
         # Clean up
+        stop_event.set()
+        reader.join(timeout=1.0)
         cap.release()
         cv2.destroyAllWindows()  # ✅ CLOSE ALL WINDOWS
+        detector_pool.shutdown(wait=True)
+        db_executor.shutdown(wait=True)
         
         if attendance_verified:
             print("\n" + "=" * 60)
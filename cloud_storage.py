@@ -1,6 +1,41 @@
+import io
 import os
+import threading
 from typing import Optional
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+# Objects at least this big go through the managed multipart uploader;
+# typical face JPEGs are far smaller and take a single put_object
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+_TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, max_concurrency=8)
+
+# One client per process: creating a boto3 client (endpoint resolution,
+# loading service models) costs far more than an upload of a small image
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """Lazily create the shared, thread-safe S3 client with pooled keep-alive connections"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.client(
+                    "s3",
+                    aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+                    region_name=os.environ.get("AWS_REGION"),
+                    config=Config(
+                        max_pool_connections=50,
+                        tcp_keepalive=True,
+                        retries={"max_attempts": 3, "mode": "adaptive"},
+                    ),
+                )
+    return _client
 
 
 class S3Client:
@@ -9,21 +44,21 @@ class S3Client:
         if not self.bucket:
             raise ValueError("S3 bucket not configured. Set S3_BUCKET env var or pass bucket.")
         self.prefix = prefix.rstrip("/") + "/"
-        self.s3 = boto3.client(
-            "s3",
-            aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-            region_name=os.environ.get("AWS_REGION"),
-        )
+        self.s3 = get_s3_client()
 
     def put_image(self, person_name: str, filename: str, data: bytes) -> str:
         key = f"{self.prefix}{person_name}/{filename}"
-        self.s3.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="image/jpeg")
+        if len(data) >= MULTIPART_THRESHOLD:
+            # Large uploads are split into parts sent in parallel
+            self.s3.upload_fileobj(
+                io.BytesIO(data), self.bucket, key,
+                ExtraArgs={"ContentType": "image/jpeg"}, Config=_TRANSFER_CONFIG,
+            )
+        else:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="image/jpeg")
         return key
 
     def presigned_url(self, key: str, expires_in: int = 3600) -> str:
         return self.s3.generate_presigned_url(
             "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_in
         )
-
-
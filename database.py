@@ -6,7 +6,11 @@ Supports PostgreSQL (preferred) and SQLite (default for local testing).
 
 from __future__ import annotations
 
+import json
+import logging
 import os
+import time
+import uuid
 from typing import List, Optional, Tuple
 
 import numpy as np
@@ -16,16 +20,39 @@ from sqlalchemy import (
     Integer,
     LargeBinary,
     String,
+    Text,
     Date,
+    Index,
     create_engine,
+    event,
     func,
+    inspect,
     text,
 )
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
 
 Base = declarative_base()
 
+# face_recognition encodings are 128-d; matrices returned by the repositories are (N, ENCODING_LENGTH)
+ENCODING_LENGTH = 128
+# New encodings are stored as float16 (256 B instead of 1 KB as float64).
+# Encoding components sit well inside [-1, 1], where half precision's ~5e-4
+# relative error moves distances by ~1e-3 against a 0.6 tolerance. Older
+# float32/float64 rows still decode through their dtype column, and reads
+# always widen to at least float32 for matching
+ENCODING_DTYPE = np.float16
+# Cached matrices are trusted this long before re-checking the table's
+# (COUNT(*), MAX(id)) for writes made by other processes
+MATRIX_RECHECK_SECONDS = 2.0
+# Bulk writes send at most this many rows per executemany() call
+BULK_CHUNK_ROWS = 5000
+# Uploaded photos are written here as files and rows keep only their path;
+# multi-KB image BLOBs inline bloat every row read (and TOAST on PostgreSQL)
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", os.path.join("data", "images"))
+
 
 class Face(Base):
     __tablename__ = "faces"
@@ -63,6 +90,11 @@ class Attendance(Base):
     time = Column(DateTime, server_default=func.now(), nullable=False)
     status = Column(String, nullable=False, default="Present")
 
+    __table_args__ = (
+        Index("uq_attendance_student_date", "student_id", "date", unique=True),
+        Index("ix_attendance_date", "date"),
+    )
+
 
 class AttendancePresent(Base):
     __tablename__ = "attendance_present"
@@ -72,6 +104,11 @@ class AttendancePresent(Base):
     date = Column(Date, nullable=False)
     time = Column(DateTime, server_default=func.now(), nullable=False)
 
+    __table_args__ = (
+        Index("uq_attendance_present_student_date", "student_id", "date", unique=True),
+        Index("ix_attendance_present_date", "date"),
+    )
+
 
 class AttendanceAbsent(Base):
     __tablename__ = "attendance_absent"
@@ -80,6 +117,30 @@ class AttendanceAbsent(Base):
     student_id = Column(Integer, nullable=False)
     date = Column(Date, nullable=False)
 
+    __table_args__ = (
+        Index("uq_attendance_absent_student_date", "student_id", "date", unique=True),
+        Index("ix_attendance_absent_date", "date"),
+    )
+
+
+class EncodingPack(Base):
+    """One table's encodings as a single contiguous float32 matrix plus JSON metadata.
+
+    Matrix reads load this one row instead of decoding a BLOB per face. It is
+    a cache: (rows, max_id) must match the source table or it is rebuilt.
+    Every write picks a new `generation`, and writers that keep rows and
+    max_id (updates) delete the row, so processes can spot each other's changes.
+    """
+    __tablename__ = "encoding_packs"
+
+    source = Column(String, primary_key=True)
+    rows = Column(Integer, nullable=False)
+    dim = Column(Integer, nullable=False)
+    max_id = Column(Integer, nullable=False)
+    matrix = Column(LargeBinary, nullable=False)
+    meta = Column(Text, nullable=False)
+    generation = Column(String, nullable=False)
+
 
 def get_engine(db_url: str):
     if db_url.startswith("sqlite"):
@@ -90,11 +151,302 @@ def get_engine(db_url: str):
                 os.makedirs(os.path.dirname(tail), exist_ok=True)
         except Exception:
             pass
-    return create_engine(db_url, future=True)
+        engine = create_engine(db_url, future=True)
+
+        @event.listens_for(engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, _record):
+            # WAL lets exports read while the recognition loop writes, and with
+            # synchronous=NORMAL a commit no longer waits on an fsync
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+            cur.execute("PRAGMA mmap_size=268435456")
+            cur.execute("PRAGMA temp_store=MEMORY")
+            cur.close()
+
+        return engine
+    driver = make_url(db_url).get_driver_name()
+    if driver == "psycopg2":
+        # Multi-row VALUES for bulk INSERTs, execute_batch for bulk UPDATEs
+        return create_engine(
+            db_url, future=True, executemany_mode="values_plus_batch", insertmanyvalues_page_size=10000
+        )
+    if driver == "psycopg":
+        # psycopg 3 can keep server-side prepared statements per connection;
+        # preparing from the first execution skips re-planning the per-frame
+        # attendance queries
+        return create_engine(
+            db_url, future=True, insertmanyvalues_page_size=10000, connect_args={"prepare_threshold": 0}
+        )
+    return create_engine(db_url, future=True, insertmanyvalues_page_size=10000)
+
+
+def _as_blob(arr: np.ndarray) -> memoryview:
+    """Zero-copy byte view of an array for a LargeBinary column (both DBAPIs accept buffers)."""
+    return memoryview(np.ascontiguousarray(arr)).cast("B")
+
+
+def _decode_encoding(blob: bytes, dtype: str, length: int) -> np.ndarray:
+    arr = np.frombuffer(blob, dtype=dtype).reshape(-1)
+    if arr.size != length:
+        arr = np.frombuffer(blob, dtype=np.float64).reshape(-1)
+    if arr.dtype == np.float16:
+        arr = arr.astype(np.float32)
+    return arr
+
+
+def _store_image(image_bytes: Optional[bytes], image_path: Optional[str]) -> Optional[str]:
+    """Write uploaded image bytes under IMAGE_STORE_DIR and return the path to record.
+
+    Bytes already stored remotely (an s3:// style URL) aren't duplicated locally.
+    """
+    if not image_bytes or (image_path and "://" in image_path):
+        return image_path
+    if image_bytes[:2] == b"\xff\xd8":
+        ext = ".jpg"
+    elif image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        ext = ".png"
+    else:
+        ext = os.path.splitext(image_path or "")[1].lower() or ".img"
+    os.makedirs(IMAGE_STORE_DIR, exist_ok=True)
+    path = os.path.join(IMAGE_STORE_DIR, uuid.uuid4().hex + ext)
+    with open(path, "wb") as f:
+        f.write(image_bytes)
+    return path
+
+
+def _discard_image(stored_path: Optional[str], image_path: Optional[str]) -> None:
+    """Remove a file _store_image() wrote for a row that was never committed."""
+    if stored_path and stored_path != image_path:
+        try:
+            os.remove(stored_path)
+        except OSError:
+            pass
+
+
+def _chunks(items: list, size: int = BULK_CHUNK_ROWS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _insert_row(session: Session, model, params: dict) -> int:
+    """INSERT one row into `model`'s table and return its id from the same round trip.
+
+    SQLAlchemy reads the key via RETURNING where the backend supports it and
+    cursor.lastrowid otherwise, so no follow-up SELECT/refresh is needed.
+    """
+    return int(session.execute(model.__table__.insert(), params).inserted_primary_key[0])
+
+
+def _bulk_insert(session: Session, model, params: List[dict]) -> List[int]:
+    """executemany() INSERT of `params` into `model`'s table, returning the new ids in order.
+
+    SQLAlchemy batches each chunk into multi-row INSERT ... RETURNING
+    statements (insertmanyvalues) instead of one round trip per row.
+    """
+    stmt = model.__table__.insert().returning(model.__table__.c.id, sort_by_parameter_order=True)
+    ids: List[int] = []
+    for chunk in _chunks(params):
+        ids.extend(int(i) for i in session.execute(stmt, chunk).scalars())
+    return ids
+
+
+def _decode_matrix(blobs: List[bytes], dtypes: List[str]) -> np.ndarray:
+    """Stack encoding BLOBs into one (N, ENCODING_LENGTH) matrix.
+
+    When every row shares a dtype (the normal case) this is one b"".join and
+    one np.frombuffer; tables mixing storage dtypes are decoded one dtype
+    group at a time into the widest (at least float32).
+    """
+    kinds = set(dtypes)
+    if len(kinds) <= 1:
+        dtype = kinds.pop() if kinds else np.float32
+        matrix = np.frombuffer(b"".join(blobs), dtype=dtype).reshape(-1, ENCODING_LENGTH)
+        # Half-precision storage is widened once here, never matched directly
+        return matrix.astype(np.float32) if matrix.dtype == np.float16 else matrix
+    matrix = np.empty((len(blobs), ENCODING_LENGTH), dtype=np.result_type(np.float32, *kinds))
+    for kind in kinds:
+        idx = [i for i, d in enumerate(dtypes) if d == kind]
+        matrix[idx] = np.frombuffer(b"".join(blobs[i] for i in idx), dtype=kind).reshape(-1, ENCODING_LENGTH)
+    return matrix
+
+
+def _table_key(session: Session, source: str) -> Tuple[int, int, Optional[str]]:
+    """(row count, max id, pack generation) of table `source`.
+
+    Row count and max id change on any insert or delete; the pack generation
+    changes when any process updates rows in place (which drops the pack).
+    """
+    rows, max_id, generation = session.execute(text(
+        f"SELECT COUNT(*), COALESCE(MAX(id), 0), "
+        f"(SELECT generation FROM encoding_packs WHERE source = :s) FROM {source}"
+    ), {"s": source}).one()
+    return int(rows), int(max_id), generation
+
+
+def _load_pack(session: Session, source: str, key: Tuple[int, int, Optional[str]]):
+    """(matrix, meta) from the packed copy of table `source`, or None if missing or not built at `key`."""
+    pack = session.get(EncodingPack, source)
+    if pack is None or pack.dim != ENCODING_LENGTH or (pack.rows, pack.max_id) != key[:2]:
+        return None
+    matrix = np.frombuffer(pack.matrix, dtype=np.float32).reshape(pack.rows, pack.dim)
+    return matrix, json.loads(pack.meta)
+
+
+def _store_pack(session: Session, source: str, matrix: np.ndarray, meta: list, max_id: int) -> Optional[str]:
+    """Write (or replace) the packed copy of table `source`; returns its generation, or None if not stored."""
+    generation = uuid.uuid4().hex
+    try:
+        session.merge(EncodingPack(
+            source=source,
+            rows=int(matrix.shape[0]),
+            dim=int(matrix.shape[1]),
+            max_id=int(max_id),
+            matrix=_as_blob(np.ascontiguousarray(matrix, dtype=np.float32)),
+            meta=json.dumps(meta),
+            generation=generation,
+        ))
+        session.commit()
+        return generation
+    except Exception:
+        # Only a cache; a concurrent rebuild may have won the race
+        session.rollback()
+        return None
+
+
+def _drop_pack(session: Session, source: str) -> None:
+    """Invalidate `source`'s pack for changes (id reuse, updates) that keep its row count and max id."""
+    session.execute(text("DELETE FROM encoding_packs WHERE source = :s"), {"s": source})
+
+
+logger = logging.getLogger(__name__)
+
+# Statements run for every recognized face are built once, so each call is a
+# compiled-cache hit instead of constructing and compiling a new statement
+_ATTENDANCE_MARKED_SQL = text("SELECT 1 FROM attendance WHERE student_id=:sid AND date=:d LIMIT 1")
+_PRESENT_MARKED_SQL = text("SELECT 1 FROM attendance_present WHERE student_id=:sid AND date=:d LIMIT 1")
+_insert_ignore_stmts: dict = {}
+# (engine, table name) -> whether its unique (student_id, date) index exists;
+# filled in by init_db() or on first use. Tables without it keep the NOT EXISTS guard.
+_unique_index_ok: dict = {}
+_UNIQUE_DAY_COLUMNS = ["student_id", "date"]
+
+
+def _has_unique_day_index(session: Session, model) -> bool:
+    """Whether `model`'s table has the unique (student_id, date) index ON CONFLICT relies on."""
+    key = (session.bind, model.__tablename__)
+    ok = _unique_index_ok.get(key)
+    if ok is None:
+        ok = any(
+            ix.get("unique") and list(ix["column_names"]) == _UNIQUE_DAY_COLUMNS
+            for ix in inspect(session.bind).get_indexes(model.__tablename__)
+        )
+        _unique_index_ok[key] = ok
+    return ok
+
+
+def _insert_ignore(session: Session, model, **values):
+    """INSERT a row, or do nothing if it would duplicate the unique (student_id, date) index.
+
+    One statement instead of SELECT-then-INSERT. Returns the result, or None
+    on dialects without ON CONFLICT support or when the unique index is
+    missing (e.g. it couldn't be built), where callers keep the old path.
+    """
+    if not _has_unique_day_index(session, model):
+        return None
+    dialect = session.bind.dialect.name
+    stmt = _insert_ignore_stmts.get((dialect, model))
+    if stmt is None:
+        if dialect == "sqlite":
+            stmt = sqlite.insert(model).on_conflict_do_nothing(index_elements=_UNIQUE_DAY_COLUMNS)
+        elif dialect == "postgresql":
+            stmt = postgresql.insert(model).on_conflict_do_nothing(index_elements=_UNIQUE_DAY_COLUMNS)
+        else:
+            return None
+        _insert_ignore_stmts[(dialect, model)] = stmt
+    return session.execute(stmt, values)
+
+
+# pgvector copy of students.encoding, present only after enable_vector_search()
+_SET_VECTOR_SQL = text("UPDATE students SET encoding_vec = CAST(:v AS vector) WHERE id = :id")
+_NEAREST_VECTOR_SQL = text(
+    "SELECT id, student_id, name, encoding_vec <-> CAST(:p AS vector) AS distance FROM students "
+    "WHERE encoding_vec IS NOT NULL ORDER BY encoding_vec <-> CAST(:p AS vector) LIMIT :k"
+)
+
+
+def _vector_literal(arr: np.ndarray) -> str:
+    """pgvector's text input form, '[x1,x2,...]'."""
+    return "[" + ",".join(f"{x:.7g}" for x in np.asarray(arr, dtype=np.float32).reshape(-1).tolist()) + "]"
+
+
+def enable_vector_search(engine) -> bool:
+    """Give students a pgvector column with an HNSW index and backfill it (PostgreSQL only).
+
+    Uses L2 distance to match the Euclidean tolerance used everywhere else.
+    Returns False on other backends or if the vector extension can't be
+    created; StudentRepository.find_nearest() then scans the matrix instead.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text(f"ALTER TABLE students ADD COLUMN IF NOT EXISTS encoding_vec vector({ENCODING_LENGTH})"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_students_encoding_vec ON students USING hnsw (encoding_vec vector_l2_ops)"
+            ))
+    except Exception:
+        return False
+    matrix, meta = StudentRepository(get_session_maker(engine)).get_matrix_f32()
+    params = [{"id": m[0], "v": _vector_literal(row)} for m, row in zip(meta, matrix)]
+    with engine.begin() as conn:
+        for chunk in _chunks(params):
+            conn.execute(_SET_VECTOR_SQL, chunk)
+    return True
 
 
 def init_db(engine) -> None:
+    # encoding_packs is only a cache, so one from before the generation
+    # column is dropped and rebuilt on the next matrix read
+    inspector = inspect(engine)
+    if inspector.has_table("encoding_packs"):
+        columns = {c["name"] for c in inspector.get_columns("encoding_packs")}
+        if "generation" not in columns:
+            EncodingPack.__table__.drop(engine)
     Base.metadata.create_all(engine)
+    # create_all() skips tables that already exist, so add indexes introduced
+    # since an older database was created
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                try:
+                    with engine.begin() as conn:
+                        if index.unique:
+                            _drop_duplicates(conn, index)
+                        index.create(conn)
+                except Exception as e:
+                    logger.error("Could not create index %s on %s: %s", index.name, table.name, e)
+                    if index.unique:
+                        _unique_index_ok[(engine, table.name)] = False
+                    continue
+            if index.unique:
+                _unique_index_ok[(engine, table.name)] = True
+
+
+def _drop_duplicates(conn, index) -> None:
+    """Delete rows that would break unique `index`, keeping the lowest id of each group."""
+    table = index.table.name
+    columns = ", ".join(c.name for c in index.columns)
+    # The derived table lets MySQL delete from the table it selects from
+    result = conn.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN "
+        f"(SELECT id FROM (SELECT MIN(id) AS id FROM {table} GROUP BY {columns}) AS keep)"
+    ))
+    if result.rowcount:
+        logger.warning("Removed %d duplicate (%s) rows from %s", result.rowcount, columns, table)
 
 
 def get_session_maker(engine) -> sessionmaker:
@@ -106,6 +458,11 @@ class FaceRepository:
 
     def __init__(self, session_maker: sessionmaker):
         self._session_maker = session_maker
+        # Bumped on every write through this repository; the matrix cache is keyed on it
+        self._version = 0
+        # (key, checked_at, matrix, names); key is (version, row count, max id, pack generation)
+        self._f32_cache: Optional[Tuple[Tuple[int, int, int, Optional[str]], float, np.ndarray, List[Optional[str]]]] = None
+        self._matrix_cache: Optional[Tuple[np.ndarray, np.ndarray]] = None
 
     def add_face(
         self,
@@ -116,33 +473,103 @@ class FaceRepository:
     ) -> int:
         if not isinstance(encoding, np.ndarray):
             raise ValueError("encoding must be a numpy.ndarray")
-        arr = np.asarray(encoding)
-        face = Face(
-            name=name,
-            encoding=arr.tobytes(),
-            length=int(arr.size),
-            dtype=str(arr.dtype),
-            image_path=image_path,
-            image_data=image_bytes,
-        )
+        arr = np.asarray(encoding, dtype=ENCODING_DTYPE)
+        stored_path = _store_image(image_bytes, image_path)
+        params = {
+            "name": name,
+            "encoding": _as_blob(arr),
+            "length": int(arr.size),
+            "dtype": str(arr.dtype),
+            "image_path": stored_path,
+        }
+        with self._session_maker() as session:  # type: Session
+            try:
+                new_id = _insert_row(session, Face, params)
+                session.commit()
+            except Exception:
+                _discard_image(stored_path, image_path)
+                raise
+            self._version += 1
+            return new_id
+
+    def add_faces_bulk(self, items: List[Tuple[Optional[str], np.ndarray]]) -> List[int]:
+        """Insert many (name, encoding) pairs in one transaction; returns their ids."""
+        params = []
+        for name, encoding in items:
+            arr = np.asarray(encoding, dtype=ENCODING_DTYPE)
+            params.append({"name": name, "encoding": _as_blob(arr), "length": int(arr.size), "dtype": str(arr.dtype)})
+        if not params:
+            return []
         with self._session_maker() as session:  # type: Session
-            session.add(face)
+            ids = _bulk_insert(session, Face, params)
             session.commit()
-            session.refresh(face)
-            return int(face.id)
+            self._version += 1
+            return ids
 
     def get_all_faces(self) -> Tuple[List[np.ndarray], List[Optional[str]]]:
         with self._session_maker() as session:  # type: Session
-            rows = session.query(Face).all()
-            names: List[Optional[str]] = []
-            encodings: List[np.ndarray] = []
-            for r in rows:
-                arr = np.frombuffer(r.encoding, dtype=r.dtype).reshape(-1)
-                if arr.size != r.length:
-                    arr = np.frombuffer(r.encoding, dtype=np.float64).reshape(-1)
-                encodings.append(arr)
-                names.append(r.name or "Unknown")
-            return encodings, names
+            rows = session.query(Face.encoding, Face.dtype, Face.name).order_by(Face.id).all()
+        matrix = _decode_matrix([r.encoding for r in rows], [r.dtype for r in rows])
+        return list(matrix), [r.name or "Unknown" for r in rows]
+
+    def get_faces_matrix_f32(self) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """All face encodings as one read-only C-contiguous (N, 128) float32 array, plus names.
+
+        Loaded from the encoding_packs row when it is current, otherwise
+        decoded row by row and re-packed. Cached on this repository until
+        the next write through it or until the table's row count, max id or
+        pack generation changes, which is re-checked at most every
+        MATRIX_RECHECK_SECONDS.
+        """
+        now = time.monotonic()
+        cache = self._f32_cache
+        if cache is not None and cache[0][0] == self._version and now - cache[1] < MATRIX_RECHECK_SECONDS:
+            return cache[2], cache[3]
+        version = self._version
+        with self._session_maker() as session:  # type: Session
+            key = (version,) + _table_key(session, "faces")
+            if cache is not None and cache[0] == key:
+                self._f32_cache = (key, now, cache[2], cache[3])
+                return cache[2], cache[3]
+            packed = _load_pack(session, "faces", key[1:])
+            if packed is not None:
+                matrix, names = packed
+            else:
+                rows = session.query(Face.encoding, Face.dtype, Face.name, Face.id).order_by(Face.id).all()
+                matrix = np.ascontiguousarray(
+                    _decode_matrix([r.encoding for r in rows], [r.dtype for r in rows]), dtype=np.float32
+                )
+                names = [r.name or "Unknown" for r in rows]
+                generation = _store_pack(session, "faces", matrix, names, max((r.id for r in rows), default=0))
+                key = key[:3] + (generation,)
+        self._f32_cache = (key, now, matrix, names)
+        return matrix, names
+
+    def get_all_faces_matrix(self) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """get_faces_matrix_f32() widened to float64."""
+        matrix, names = self.get_faces_matrix_f32()
+        cache = self._matrix_cache
+        if cache is None or cache[0] is not matrix:
+            cache = (matrix, matrix.astype(np.float64))
+            self._matrix_cache = cache
+        return cache[1], names
+
+    def delete_face(self, face_id: int) -> None:
+        with self._session_maker() as session:  # type: Session
+            image_path = session.execute(
+                text("SELECT image_path FROM faces WHERE id = :id"), {"id": int(face_id)}
+            ).scalar()
+            session.execute(text("DELETE FROM faces WHERE id = :id"), {"id": int(face_id)})
+            # SQLite may hand a deleted max id to the next insert
+            _drop_pack(session, "faces")
+            session.commit()
+            self._version += 1
+        # Remove the photo only if it lives in our image store
+        if image_path and os.path.dirname(os.path.abspath(image_path)) == os.path.abspath(IMAGE_STORE_DIR):
+            try:
+                os.remove(image_path)
+            except OSError:
+                pass
 
     def list_faces(self) -> List[Face]:
         with self._session_maker() as session:  # type: Session
@@ -152,63 +579,189 @@ class FaceRepository:
 class StudentRepository:
     def __init__(self, session_maker: sessionmaker):
         self._session_maker = session_maker
+        # Bumped on every write through this repository; the matrix cache is keyed on it
+        self._version = 0
+        # (key, checked_at, matrix, meta); key is (version, row count, max id, pack generation)
+        self._f32_cache: Optional[Tuple[Tuple[int, int, int, Optional[str]], float, np.ndarray, List[Tuple[int, str, str]]]] = None
+        self._matrix_cache: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # Whether students has the pgvector column; looked up on first use
+        self._has_vector: Optional[bool] = None
+
+    def _vector_enabled(self, session: Session) -> bool:
+        if self._has_vector is None:
+            self._has_vector = session.bind.dialect.name == "postgresql" and session.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'students' AND column_name = 'encoding_vec'"
+            )).first() is not None
+        return self._has_vector
+
+    def _sync_vectors(self, session: Session, rows: List[Tuple[int, np.ndarray]]) -> None:
+        """Mirror written encodings into encoding_vec when vector search is enabled."""
+        if rows and self._vector_enabled(session):
+            params = [{"id": int(i), "v": _vector_literal(arr)} for i, arr in rows]
+            for chunk in _chunks(params):
+                session.execute(_SET_VECTOR_SQL, chunk)
 
     def add_student(self, student_id: str, name: str, encoding: np.ndarray, image_path: Optional[str] = None, image_bytes: Optional[bytes] = None) -> int:
-        arr = np.asarray(encoding)
-        row = Student(
-            student_id=student_id,
-            name=name,
-            encoding=arr.tobytes(),
-            length=int(arr.size),
-            dtype=str(arr.dtype),
-            image_path=image_path,
-            image_data=image_bytes,
-        )
+        arr = np.asarray(encoding, dtype=ENCODING_DTYPE)
+        stored_path = _store_image(image_bytes, image_path)
+        params = {
+            "student_id": student_id,
+            "name": name,
+            "encoding": _as_blob(arr),
+            "length": int(arr.size),
+            "dtype": str(arr.dtype),
+            "image_path": stored_path,
+        }
         with self._session_maker() as session:  # type: Session
-            session.add(row)
+            try:
+                new_id = _insert_row(session, Student, params)
+                self._sync_vectors(session, [(new_id, arr)])
+                session.commit()
+            except Exception:
+                # e.g. a duplicate student_id; don't leave the photo orphaned
+                _discard_image(stored_path, image_path)
+                raise
+            self._version += 1
+            return new_id
+
+    def add_students_bulk(self, items: List[Tuple[str, str, np.ndarray]]) -> List[int]:
+        """Insert many (student_id, name, encoding) rows in one transaction; returns their ids."""
+        params = []
+        arrays = []
+        for student_id, name, encoding in items:
+            arr = np.asarray(encoding, dtype=ENCODING_DTYPE)
+            arrays.append(arr)
+            params.append({
+                "student_id": student_id,
+                "name": name,
+                "encoding": _as_blob(arr),
+                "length": int(arr.size),
+                "dtype": str(arr.dtype),
+            })
+        if not params:
+            return []
+        with self._session_maker() as session:  # type: Session
+            ids = _bulk_insert(session, Student, params)
+            self._sync_vectors(session, list(zip(ids, arrays)))
             session.commit()
-            session.refresh(row)
-            return int(row.id)
+            self._version += 1
+            return ids
 
     def get_all_students(self) -> List[Student]:
         with self._session_maker() as session:
             return session.query(Student).order_by(Student.created_at.desc()).all()
 
     def get_all_encodings(self) -> Tuple[List[np.ndarray], List[Tuple[int, str, str]]]:
+        """Per-row views of get_all_encodings_matrix(), sharing its cache."""
+        matrix, meta = self.get_all_encodings_matrix()
+        return list(matrix), list(meta)
+
+    def get_matrix_f32(self) -> Tuple[np.ndarray, List[Tuple[int, str, str]]]:
+        """All student encodings as one read-only C-contiguous (N, 128) float32 array, plus (id, student_id, name).
+
+        Loaded from the encoding_packs row when it is current, otherwise
+        decoded row by row and re-packed. Cached on this repository until
+        the next add_student(), add_students_bulk() or
+        update_student_encoding() through it, or until the table's row count,
+        max id or pack generation changes (so updates from other processes,
+        which drop the pack, are seen too), re-checked at most every
+        MATRIX_RECHECK_SECONDS.
+        """
+        now = time.monotonic()
+        cache = self._f32_cache
+        if cache is not None and cache[0][0] == self._version and now - cache[1] < MATRIX_RECHECK_SECONDS:
+            return cache[2], cache[3]
+        version = self._version
         with self._session_maker() as session:
-            rows = session.query(Student).all()
-            encodings: List[np.ndarray] = []
-            meta: List[Tuple[int, str, str]] = []  # (id, student_id, name)
-            for r in rows:
-                arr = np.frombuffer(r.encoding, dtype=r.dtype).reshape(-1)
-                if arr.size != r.length:
-                    arr = np.frombuffer(r.encoding, dtype=np.float64).reshape(-1)
-                encodings.append(arr)
-                meta.append((int(r.id), r.student_id, r.name))
-            return encodings, meta
+            key = (version,) + _table_key(session, "students")
+            if cache is not None and cache[0] == key:
+                self._f32_cache = (key, now, cache[2], cache[3])
+                return cache[2], cache[3]
+            packed = _load_pack(session, "students", key[1:])
+            if packed is not None:
+                matrix = packed[0]
+                meta = [tuple(m) for m in packed[1]]
+            else:
+                rows = session.query(
+                    Student.encoding, Student.dtype, Student.id, Student.student_id, Student.name
+                ).order_by(Student.id).all()
+                matrix = np.ascontiguousarray(
+                    _decode_matrix([r.encoding for r in rows], [r.dtype for r in rows]), dtype=np.float32
+                )
+                meta = [(int(r.id), r.student_id, r.name) for r in rows]  # (id, student_id, name)
+                generation = _store_pack(session, "students", matrix, meta, max((m[0] for m in meta), default=0))
+                key = key[:3] + (generation,)
+        self._f32_cache = (key, now, matrix, meta)
+        return matrix, meta
+
+    def get_all_encodings_matrix(self) -> Tuple[np.ndarray, List[Tuple[int, str, str]]]:
+        """get_matrix_f32() widened to float64."""
+        matrix, meta = self.get_matrix_f32()
+        cache = self._matrix_cache
+        if cache is None or cache[0] is not matrix:
+            cache = (matrix, matrix.astype(np.float64))
+            self._matrix_cache = cache
+        return cache[1], meta
+
+    def find_nearest(self, probe: np.ndarray, k: int = 1) -> List[Tuple[int, str, str, float]]:
+        """The k students closest to `probe` as (id, student_id, name, distance), nearest first.
+
+        With enable_vector_search() this is an approximate HNSW lookup inside
+        PostgreSQL; otherwise an exact scan of the cached float32 matrix.
+        """
+        with self._session_maker() as session:
+            if self._vector_enabled(session):
+                rows = session.execute(_NEAREST_VECTOR_SQL, {"p": _vector_literal(probe), "k": int(k)}).fetchall()
+                return [(int(r[0]), r[1], r[2], float(r[3])) for r in rows]
+        matrix, meta = self.get_matrix_f32()
+        if not len(matrix):
+            return []
+        q = np.asarray(probe, dtype=np.float32).reshape(-1)
+        d2 = np.einsum("ij,ij->i", matrix, matrix) - 2.0 * (matrix @ q) + q @ q
+        order = np.argsort(d2)[:k]
+        return [meta[i] + (float(np.sqrt(max(d2[i], 0.0))),) for i in order.tolist()]
 
     def get_encoding_by_db_id(self, student_db_id: int) -> Optional[np.ndarray]:
         with self._session_maker() as session:
             r = session.query(Student).filter(Student.id == student_db_id).first()
             if not r:
                 return None
-            arr = np.frombuffer(r.encoding, dtype=r.dtype).reshape(-1)
-            if arr.size != r.length:
-                arr = np.frombuffer(r.encoding, dtype=np.float64).reshape(-1)
-            return arr
+            return _decode_encoding(r.encoding, r.dtype, r.length)
 
     def update_student_encoding(self, student_db_id: int, new_encoding: np.ndarray) -> bool:
-        arr = np.asarray(new_encoding)
+        arr = np.asarray(new_encoding, dtype=ENCODING_DTYPE)
         with self._session_maker() as session:
             session.execute(
                 text(
                     "UPDATE students SET encoding=:enc, length=:len, dtype=:dtype WHERE id=:id"
                 ),
-                {"enc": arr.tobytes(), "len": int(arr.size), "dtype": str(arr.dtype), "id": int(student_db_id)},
+                {"enc": _as_blob(arr), "len": int(arr.size), "dtype": str(arr.dtype), "id": int(student_db_id)},
             )
+            self._sync_vectors(session, [(student_db_id, arr)])
+            _drop_pack(session, "students")
             session.commit()
+            self._version += 1
             return True
 
+    def update_student_encodings_bulk(self, items: List[Tuple[int, np.ndarray]]) -> int:
+        """Apply many (student_db_id, encoding) updates with executemany() in one transaction."""
+        params = []
+        for student_db_id, encoding in items:
+            arr = np.asarray(encoding, dtype=ENCODING_DTYPE)
+            params.append({"enc": _as_blob(arr), "len": int(arr.size), "dtype": str(arr.dtype), "id": int(student_db_id)})
+        if not params:
+            return 0
+        stmt = text("UPDATE students SET encoding=:enc, length=:len, dtype=:dtype WHERE id=:id")
+        with self._session_maker() as session:
+            for chunk in _chunks(params):
+                session.execute(stmt, chunk)
+            self._sync_vectors(session, items)
+            _drop_pack(session, "students")
+            session.commit()
+            self._version += 1
+            return len(params)
+
 
 class AttendanceRepository:
     def __init__(self, session_maker: sessionmaker):
@@ -219,6 +772,12 @@ class AttendanceRepository:
         if not hasattr(on_date, "year"):
             on_date = date_cls.today()
         with self._session_maker() as session:
+            # The unique (student_id, date) index rejects a second row for the day
+            result = _insert_ignore(session, Attendance, student_id=student_db_id, date=on_date, status="Present")
+            if result is not None:
+                session.commit()
+                if result.rowcount:
+                    return int(result.inserted_primary_key[0])
             # Prevent duplicate for day
             existing = session.query(Attendance).filter(Attendance.student_id == student_db_id, Attendance.date == on_date).first()
             if existing:
@@ -231,7 +790,7 @@ class AttendanceRepository:
 
     def has_marked_today(self, student_db_id: int, on_date) -> bool:
         with self._session_maker() as session:
-            existing = session.query(Attendance).filter(Attendance.student_id == student_db_id, Attendance.date == on_date).first()
+            existing = session.execute(_ATTENDANCE_MARKED_SQL, {"sid": student_db_id, "d": on_date}).first()
             return existing is not None
 
     def export_range(self, start_date, end_date) -> List[Tuple[str, str, str]]:
@@ -259,12 +818,7 @@ class AttendancePresentRepository:
 
     def has_marked_today(self, student_db_id: int, on_date) -> bool:
         with self._session_maker() as session:
-            existing = session.execute(
-                text(
-                    "SELECT 1 FROM attendance_present WHERE student_id=:sid AND date=:d LIMIT 1"
-                ),
-                {"sid": student_db_id, "d": on_date},
-            ).fetchone()
+            existing = session.execute(_PRESENT_MARKED_SQL, {"sid": student_db_id, "d": on_date}).fetchone()
             return existing is not None
 
     def mark_present(self, student_db_id: int, on_date) -> int:
@@ -272,6 +826,11 @@ class AttendancePresentRepository:
         if not hasattr(on_date, "year"):
             on_date = date_cls.today()
         with self._session_maker() as session:
+            result = _insert_ignore(session, AttendancePresent, student_id=student_db_id, date=on_date)
+            if result is not None:
+                session.commit()
+                # The new row's id (RETURNING on PostgreSQL, lastrowid on SQLite); 0 if already marked
+                return int(result.inserted_primary_key[0]) if result.rowcount else 0
             session.execute(
                 text(
                     "INSERT INTO attendance_present (student_id, date) SELECT :sid, :d WHERE NOT EXISTS (SELECT 1 FROM attendance_present WHERE student_id=:sid AND date=:d)"
@@ -279,8 +838,7 @@ class AttendancePresentRepository:
                 {"sid": student_db_id, "d": on_date},
             )
             session.commit()
-            rowid = session.execute(text("SELECT last_insert_rowid()")).scalar() if session.bind.dialect.name == "sqlite" else 0
-            return int(rowid or 0)
+            return 0
 
     def export_range(self, start_date, end_date) -> List[Tuple[str, str, str]]:
         with self._session_maker() as session:
@@ -305,12 +863,13 @@ class AttendanceAbsentRepository:
 
     def mark_absent(self, student_db_id: int, on_date) -> None:
         with self._session_maker() as session:
-            session.execute(
-                text(
-                    "INSERT INTO attendance_absent (student_id, date) SELECT :sid, :d WHERE NOT EXISTS (SELECT 1 FROM attendance_absent WHERE student_id=:sid AND date=:d)"
-                ),
-                {"sid": student_db_id, "d": on_date},
-            )
+            if _insert_ignore(session, AttendanceAbsent, student_id=student_db_id, date=on_date) is None:
+                session.execute(
+                    text(
+                        "INSERT INTO attendance_absent (student_id, date) SELECT :sid, :d WHERE NOT EXISTS (SELECT 1 FROM attendance_absent WHERE student_id=:sid AND date=:d)"
+                    ),
+                    {"sid": student_db_id, "d": on_date},
+                )
             session.commit()
 
     def export_range(self, start_date, end_date) -> List[Tuple[str, str, str]]:
@@ -344,51 +903,76 @@ class StudentSample(Base):
     source = Column(String, nullable=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
+    # get_samples() and delete_oldest() read one student's newest rows first
+    __table_args__ = (
+        Index("ix_student_samples_student_created", "student_id", created_at.desc()),
+    )
+
 
 class StudentSampleRepository:
     def __init__(self, session_maker: sessionmaker):
         self._session_maker = session_maker
 
     def add_sample(self, student_db_id: int, encoding: np.ndarray, confidence: float = 0.0, source: Optional[str] = None) -> int:
-        arr = np.asarray(encoding)
-        row = StudentSample(
-            student_id=student_db_id,
-            encoding=arr.tobytes(),
-            length=int(arr.size),
-            dtype=str(arr.dtype),
-            confidence=f"{float(confidence):.4f}",
-            source=source or "recognize",
-        )
+        arr = np.asarray(encoding, dtype=ENCODING_DTYPE)
+        params = {
+            "student_id": student_db_id,
+            "encoding": _as_blob(arr),
+            "length": int(arr.size),
+            "dtype": str(arr.dtype),
+            "confidence": f"{float(confidence):.4f}",
+            "source": source or "recognize",
+        }
         with self._session_maker() as session:  # type: Session
-            session.add(row)
+            new_id = _insert_row(session, StudentSample, params)
             session.commit()
-            session.refresh(row)
-            return int(row.id)
+            return new_id
+
+    def add_samples_bulk(self, items: List[Tuple[int, np.ndarray, float, Optional[str]]]) -> List[int]:
+        """Insert many (student_db_id, encoding, confidence, source) samples in one transaction; returns their ids."""
+        params = []
+        for student_db_id, encoding, confidence, source in items:
+            arr = np.asarray(encoding, dtype=ENCODING_DTYPE)
+            params.append({
+                "student_id": int(student_db_id),
+                "encoding": _as_blob(arr),
+                "length": int(arr.size),
+                "dtype": str(arr.dtype),
+                "confidence": f"{float(confidence):.4f}",
+                "source": source or "recognize",
+            })
+        if not params:
+            return []
+        with self._session_maker() as session:  # type: Session
+            ids = _bulk_insert(session, StudentSample, params)
+            session.commit()
+            return ids
 
-    def get_samples(self, student_db_id: int, limit: Optional[int] = None) -> List[np.ndarray]:
+    def get_samples_matrix(self, student_db_id: int, limit: Optional[int] = None) -> np.ndarray:
+        """A student's latest samples as one (N, 128) matrix, newest first."""
         with self._session_maker() as session:  # type: Session
-            q = session.query(StudentSample).filter(StudentSample.student_id == student_db_id).order_by(StudentSample.created_at.desc())
+            q = session.query(StudentSample.encoding, StudentSample.dtype).filter(
+                StudentSample.student_id == student_db_id
+            ).order_by(StudentSample.created_at.desc())
             if limit and limit > 0:
                 q = q.limit(int(limit))
             rows = q.all()
-            encs: List[np.ndarray] = []
-            for r in rows:
-                arr = np.frombuffer(r.encoding, dtype=r.dtype).reshape(-1)
-                if arr.size != r.length:
-                    arr = np.frombuffer(r.encoding, dtype=np.float64).reshape(-1)
-                encs.append(arr)
-            return encs
+        return _decode_matrix([r.encoding for r in rows], [r.dtype for r in rows])
+
+    def get_samples(self, student_db_id: int, limit: Optional[int] = None) -> List[np.ndarray]:
+        return list(self.get_samples_matrix(student_db_id, limit))
 
     def delete_oldest(self, student_db_id: int, keep_last: int = 100) -> int:
         with self._session_maker() as session:
-            # delete older rows beyond keep_last
-            session.execute(
+            # Keep the newest keep_last rows (read off the (student_id, created_at)
+            # index) and delete the rest; returns how many were deleted
+            result = session.execute(
                 text(
-                    "DELETE FROM student_samples WHERE id IN ("
-                    "SELECT id FROM student_samples WHERE student_id=:sid ORDER BY created_at DESC OFFSET :k)"
+                    "DELETE FROM student_samples WHERE student_id=:sid AND id NOT IN ("
+                    "SELECT id FROM student_samples WHERE student_id=:sid ORDER BY created_at DESC, id DESC LIMIT :k)"
                 ),
                 {"sid": student_db_id, "k": int(max(keep_last, 0))},
             )
             session.commit()
-            return 0
+            return int(result.rowcount or 0)
 
@@ -14,6 +14,8 @@ class FaceDatabase:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.conn.execute("PRAGMA journal_mode=WAL;")
+        # In WAL mode NORMAL only fsyncs at checkpoints, not on every commit
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
         self._create_tables()
 
     def _create_tables(self) -> None:
@@ -47,11 +49,30 @@ class FaceDatabase:
         self.conn.commit()
         return int(cur.lastrowid)
 
+    def add_faces(self, rows: List[Tuple[str, np.ndarray, Optional[str]]]) -> int:
+        """Insert many (name, encoding, image_path) rows in one transaction; returns how many."""
+        params = []
+        for name, encoding, image_path in rows:
+            encoding = np.ascontiguousarray(encoding)
+            params.append((name, memoryview(encoding).cast("B"), int(encoding.size), str(encoding.dtype), image_path))
+        # One BEGIN/COMMIT (one fsync) around the whole executemany()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO faces (name, encoding, length, dtype, image_path) VALUES (?, ?, ?, ?, ?)",
+                params,
+            )
+        return len(params)
+
     def get_all_faces(self) -> Tuple[List[np.ndarray], List[str]]:
         cur = self.conn.cursor()
-        cur.execute("SELECT name, encoding, length, dtype FROM faces")
+        cur.execute("SELECT name, encoding, length, dtype FROM faces ORDER BY id")
         rows = cur.fetchall()
-        names: List[str] = []
+        names: List[str] = [r[0] for r in rows]
+        if rows and all(r[2] == rows[0][2] and r[3] == rows[0][3] for r in rows):
+            # Uniform rows (the normal case): one join and one frombuffer
+            # instead of an array per row
+            matrix = np.frombuffer(b"".join(r[1] for r in rows), dtype=rows[0][3]).reshape(len(rows), rows[0][2])
+            return list(matrix), names
         encodings: List[np.ndarray] = []
         for name, blob, length, dtype in rows:
             arr = np.frombuffer(blob, dtype=dtype)
@@ -59,7 +80,6 @@ class FaceDatabase:
                 # Fallback if metadata mismatch
                 arr = np.frombuffer(blob, dtype=np.float64)
             encodings.append(arr.reshape(-1))
-            names.append(name)
         return encodings, names
 
     def delete_face(self, face_id: int) -> None:
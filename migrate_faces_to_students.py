@@ -40,11 +40,11 @@ def main() -> int:
         print("No faces found to migrate.")
         return 0
 
-    count = 0
+    rows = []
     for idx, (enc, name) in enumerate(zip(encs, names), 1):
         sid = f"{slugify(name)}_{idx:03d}"
-        student_repo.add_student(sid, name or sid, np.asarray(enc))
-        count += 1
+        rows.append((sid, name or sid, np.asarray(enc)))
+    count = len(student_repo.add_students_bulk(rows))
 
     print(f"Migrated {count} face encodings into students table.")
     return 0
@@ -18,18 +18,18 @@ from database import get_engine, init_db, get_session_maker, FaceRepository, Stu
 from utils import get_face_encodings_with_locations
 
 
-def load_known(db_url: str, attendance_mode: bool = True) -> Tuple[List[np.ndarray], List[str]]:
+def load_known(db_url: str, attendance_mode: bool = True) -> Tuple[np.ndarray, List[str]]:
     engine = get_engine(db_url)
     init_db(engine)
     Session = get_session_maker(engine)
     if attendance_mode:
         srepo = StudentRepository(Session)
-        encs, meta = srepo.get_all_encodings()
+        encs, meta = srepo.get_matrix_f32()
         names = [m[2] for m in meta]
         return encs, names
     else:
         repo = FaceRepository(Session)
-        return repo.get_all_faces()
+        return repo.get_faces_matrix_f32()
 
 
 class SharedEncodings:
@@ -37,7 +37,8 @@ class SharedEncodings:
         self.db_url = db_url
         self.refresh_interval = refresh_interval
         self.attendance_mode = attendance_mode
-        self.known_encodings: List[np.ndarray] = []
+        self.known_encodings: np.ndarray = np.empty((0, 128), dtype=np.float32)
+        self.known_half_norm_sq: np.ndarray = np.empty(0, dtype=np.float32)
         self.known_names: List[str] = []
         self._lock = threading.Lock()
         self._last_refresh = 0.0
@@ -49,16 +50,19 @@ class SharedEncodings:
             return
         try:
             enc, names = load_known(self.db_url, attendance_mode=self.attendance_mode)
+            half_norm_sq = 0.5 * np.einsum("ij,ij->i", enc, enc)
             with self._lock:
                 self.known_encodings = enc
+                self.known_half_norm_sq = half_norm_sq
                 self.known_names = names
             self._last_refresh = now
         except Exception:
             self._last_refresh = now
 
-    def snapshot(self) -> Tuple[List[np.ndarray], List[str]]:
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        # refresh() swaps in new arrays rather than mutating them, so no copy is needed
         with self._lock:
-            return list(self.known_encodings), list(self.known_names)
+            return self.known_encodings, self.known_half_norm_sq, list(self.known_names)
 
 
 def camera_worker(index: int, shared: SharedEncodings, tolerance: float, model: str, align: bool, align_size: int):
@@ -87,19 +91,19 @@ def camera_worker(index: int, shared: SharedEncodings, tolerance: float, model:
                 locs = face_recognition.face_locations(rgb, model=model)
                 encs = get_face_encodings_with_locations(rgb, locs, align=align, align_size=align_size)
 
-                known_encodings, known_names = shared.snapshot()
+                known_encodings, known_half_norm_sq, known_names = shared.snapshot()
                 face_names = []
                 for enc in encs:
                     if len(known_encodings) == 0:
                         face_names.append(("Unknown", 0.0))
                         continue
-                    dists = face_recognition.face_distance(known_encodings, enc)
-                    if dists.size == 0:
-                        face_names.append(("Unknown", 0.0))
-                        continue
-                    idx = int(np.argmin(dists))
-                    if dists[idx] <= tolerance:
-                        face_names.append((known_names[idx], float(1.0 - dists[idx])))
+                    # One SGEMV over the float32 matrix: ||k - q||^2 = ||q||^2 - 2 (k.q - ||k||^2 / 2)
+                    q = np.asarray(enc, dtype=np.float32)
+                    scores = known_encodings @ q - known_half_norm_sq
+                    idx = int(np.argmax(scores))
+                    dist = float(np.sqrt(max(q @ q - 2.0 * scores[idx], 0.0)))
+                    if dist <= tolerance:
+                        face_names.append((known_names[idx], float(1.0 - dist)))
                     else:
                         face_names.append(("Unknown", 0.0))
 
@@ -27,8 +27,8 @@ def _get_repo(db_url: str) -> FaceRepository:
 def batch_encode_folder(input_dir: str, db_url: str) -> dict:
     if not _HAS_FACE_RECOG:
         return {"added": 0, "failed": [], "error": "face_recognition_unavailable"}
-    added = 0
     failed: List[str] = []
+    new_faces: List[Tuple[str, np.ndarray]] = []
     repo = _get_repo(db_url)
 
     for fname in os.listdir(input_dir):
@@ -46,12 +46,13 @@ def batch_encode_folder(input_dir: str, db_url: str) -> dict:
                 failed.append(fname)
                 continue
             name = os.path.splitext(fname)[0].replace("_", " ").replace("-", " ").title()
-            repo.add_face(name, np.asarray(encs[0]))
-            added += 1
+            new_faces.append((name, np.asarray(encs[0])))
         except Exception:
             failed.append(fname)
 
-    return {"added": added, "failed": failed}
+    # One transaction (one fsync) for the whole folder instead of one per image
+    repo.add_faces_bulk(new_faces)
+    return {"added": len(new_faces), "failed": failed}
 
 
 @celery.task(name="recognize_image_bytes")
@@ -74,18 +75,18 @@ def recognize_image_bytes(image_b64: str, db_url: str, tolerance: float = 0.6) -
     if not encs:
         return {"results": []}
 
-    known_encs, known_names = repo.get_all_faces()
+    known_encs, known_names = repo.get_faces_matrix_f32()
+    known_half_norm_sq = 0.5 * np.einsum("ij,ij->i", known_encs, known_encs)
     results = []
     for (top, right, bottom, left), enc in zip(locs, encs):
-        if not known_encs:
+        if len(known_encs) == 0:
             results.append({"name": "Unknown", "confidence": 0.0, "box": [top, right, bottom, left]})
             continue
-        dists = face_recognition.face_distance(known_encs, enc)
-        if dists.size == 0:
-            results.append({"name": "Unknown", "confidence": 0.0, "box": [top, right, bottom, left]})
-            continue
-        idx = int(dists.argmin())
-        best = float(dists[idx])
+        # One SGEMV over the float32 matrix: ||k - q||^2 = ||q||^2 - 2 (k.q - ||k||^2 / 2)
+        q = np.asarray(enc, dtype=np.float32)
+        scores = known_encs @ q - known_half_norm_sq
+        idx = int(scores.argmax())
+        best = float(np.sqrt(max(q @ q - 2.0 * scores[idx], 0.0)))
         if best <= tolerance:
             results.append({
                 "name": known_names[idx],
@@ -107,33 +108,43 @@ def recompute_student_encodings(db_url: str, samples_limit: int = 100, min_sampl
     samp_repo = StudentSampleRepository(Session)
 
     students = srepo.get_all_students()
-    updated = 0
+    centroids = []
     skipped = 0
     for s in students:
         base = srepo.get_encoding_by_db_id(int(s.id))
-        samples = samp_repo.get_samples(int(s.id), limit=int(samples_limit))
-        if not samples:
+        samples = samp_repo.get_samples_matrix(int(s.id), limit=int(samples_limit))
+        if not len(samples):
             skipped += 1
             continue
-        stack = [base] if base is not None else []
-        stack.extend(samples)
-        if len(stack) < int(min_samples):
+        if len(samples) + (base is not None) < int(min_samples):
             skipped += 1
             continue
         try:
-            arr = np.vstack(stack)
-            centroid = arr.mean(axis=0)
-            srepo.update_student_encoding(int(s.id), centroid.astype(base.dtype if base is not None else np.float32))
-            # Trim to last N samples
-            try:
-                samp_repo.delete_oldest(int(s.id), keep_last=int(samples_limit))
-            except Exception:
-                pass
-            updated += 1
+            arr = np.vstack([base, samples]) if base is not None else samples
+            centroids.append((int(s.id), arr.mean(axis=0)))
         except Exception:
             skipped += 1
             continue
-    return {"updated": updated, "skipped": skipped}
+    # One executemany() UPDATE for every recomputed student; if that fails,
+    # retry one by one so a single bad row doesn't skip everyone
+    try:
+        srepo.update_student_encodings_bulk(centroids)
+        written = [sid for sid, _ in centroids]
+    except Exception:
+        written = []
+        for sid, centroid in centroids:
+            try:
+                srepo.update_student_encoding(sid, centroid)
+                written.append(sid)
+            except Exception:
+                skipped += 1
+    # Trim to last N samples only once the new encoding is committed
+    for sid in written:
+        try:
+            samp_repo.delete_oldest(sid, keep_last=int(samples_limit))
+        except Exception:
+            pass
+    return {"updated": len(written), "skipped": skipped}
 
 
 @celery.task(name="finalize_absentees_task")
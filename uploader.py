@@ -124,17 +124,7 @@ def create_app(db_url: str = "sqlite:///data/faces.db") -> Flask:
     @app.route("/faces/<int:face_id>/delete", methods=["POST"]) 
     def delete_face(face_id: int):
         try:
-            with Session() as s:
-                s.query(type(repo).list_faces.__annotations__.get('return', object)).filter_by(id=face_id)
-            # Simpler: direct SQL since we have small scope
-            eng = get_engine(app.config["DB_URL"])  # ensure engine
-            # Recreate repo to be safe
-            _Session = get_session_maker(eng)
-            _repo = FaceRepository(_Session)
-            # Use session to delete by id
-            with _Session() as session:
-                session.execute("DELETE FROM faces WHERE id = :id", {"id": face_id})
-                session.commit()
+            repo.delete_face(face_id)
             flash("Face deleted", "success")
         except Exception as e:
             flash(f"Failed to delete: {e}", "error")
@@ -363,10 +353,7 @@ def create_app(db_url: str = "sqlite:///data/faces.db") -> Flask:
     def api_delete_face(face_id: int):
         metrics.inc("api.faces.delete")
         try:
-            _Session = get_session_maker(get_engine(app.config["DB_URL"]))
-            with _Session() as session:
-                session.execute("DELETE FROM faces WHERE id = :id", {"id": face_id})
-                session.commit()
+            repo.delete_face(face_id)
             return jsonify({"deleted": face_id})
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -6,10 +6,16 @@ This module contains helper functions used by both the encoding and recognition
 """
 
 import pickle
+import queue
 import cv2
 import numpy as np
 from pathlib import Path
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 
 def load_encodings_from_file(encodings_file="encodings/known_faces.pkl"):
     """
@@ -45,6 +51,211 @@ def load_encodings_from_file(encodings_file="encodings/known_faces.pkl"):
         return [], []
 
 
+# face_recognition encodings are always 128-d. Numba freezes module globals as
+# compile-time constants, so loops over ENCODING_DIM get a fixed trip count that
+# LLVM can fully unroll and vectorize (16 x 8-lane FMAs on AVX2).
+ENCODING_DIM = 128
+
+# Galleries at least this large are scanned as int8 codes (4x fewer bytes per
+# row); below it the float32 matrix already fits in cache and int8 buys nothing
+QUANTIZE_MIN_ROWS = 4096
+
+
+def as_encoding_matrix(encodings):
+    """Stack face encodings into one C-contiguous (N, 128) float32 matrix, the layout the matchers expect"""
+    return np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM))
+
+
+def quantize_encodings(known_matrix):
+    """
+    Quantize (N, 128) float32 encodings to int8 with one scale per row.
+
+    Returns:
+        tuple: (codes, scales, norm_sq) where row i ~= codes[i] * scales[i] and
+               norm_sq[i] is the squared norm of that dequantized row
+    """
+    scales = np.abs(known_matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(known_matrix / scales[:, None]).astype(np.int8)
+    dequantized = codes.astype(np.float32) * scales[:, None]
+    norm_sq = (dequantized * dequantized).sum(axis=1)
+    return np.ascontiguousarray(codes), scales.astype(np.float32), norm_sq.astype(np.float32)
+
+
+# The nearest-encoding matchers below all return *squared* Euclidean distances;
+# take the square root (or square the tolerance) before comparing with a
+# face_recognition tolerance. Each uses a Numba kernel when Numba is
+# installed and a NumPy fallback with the same signature otherwise.
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _nearest_encoding(known_matrix, query, accept_sq):
+        best_idx = -1
+        best_sq = np.inf
+        for i in range(known_matrix.shape[0]):
+            s = 0.0
+            for j in range(ENCODING_DIM):
+                d = known_matrix[i, j] - query[j]
+                s += d * d
+            if s < best_sq:
+                best_idx = i
+                best_sq = s
+                if s <= accept_sq:
+                    break
+        return best_idx, best_sq
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _nearest_encodings(known_matrix, queries, out_idx, out_sq):
+        # One query per thread; squared L2 + argmin without building the F x N matrix
+        for i in prange(queries.shape[0]):
+            best_idx = -1
+            best_sq = np.inf
+            for j in range(known_matrix.shape[0]):
+                s = 0.0
+                for d in range(ENCODING_DIM):
+                    t = known_matrix[j, d] - queries[i, d]
+                    s += t * t
+                if s < best_sq:
+                    best_sq = s
+                    best_idx = j
+            out_idx[i] = best_idx
+            out_sq[i] = best_sq
+
+    @njit(cache=True, fastmath=True)
+    def nearest_encoding_int8(codes, scales, norm_sq, query, accept_sq):
+        """
+        nearest_encoding over a gallery from quantize_encodings().
+
+        Uses ||s*c - q||^2 = ||s*c||^2 - 2 s (c . q) + ||q||^2, so each row costs
+        one int8 x float32 dot product; same early exit and return value.
+        Numba only: None when Numba isn't installed.
+        """
+        query_sq = 0.0
+        for j in range(ENCODING_DIM):
+            query_sq += query[j] * query[j]
+        best_idx = -1
+        best_sq = np.inf
+        for i in range(codes.shape[0]):
+            dot = 0.0
+            for j in range(ENCODING_DIM):
+                dot += codes[i, j] * query[j]
+            s = max(norm_sq[i] - 2.0 * scales[i] * dot + query_sq, 0.0)
+            if s < best_sq:
+                best_idx = i
+                best_sq = s
+                if s <= accept_sq:
+                    break
+        return best_idx, best_sq
+else:
+    _nearest_encoding = None
+    _nearest_encodings = None
+    nearest_encoding_int8 = None
+
+
+def nearest_encoding(known_matrix, query, accept_sq=0.0, half_norm_sq=None):
+    """
+    Find the closest row of `known_matrix` (N, 128) to `query` (128,), both float32.
+
+    The Numba kernel scans rows in order and stops at the first one whose
+    squared distance is <= accept_sq, since any such match is conclusive for
+    the caller; otherwise (and always in the NumPy fallback) it returns the
+    true nearest row. The fallback is one matrix-vector product and uses
+    `half_norm_sq` (||k||^2 / 2 per row) when the caller has it cached.
+
+    Returns:
+        tuple: (row index, squared distance), or (-1, inf) for an empty matrix
+    """
+    if _nearest_encoding is not None:
+        return _nearest_encoding(known_matrix, query, accept_sq)
+    if len(known_matrix) == 0:
+        return -1, np.inf
+    if half_norm_sq is None:
+        half_norm_sq = 0.5 * np.einsum('ij,ij->i', known_matrix, known_matrix)
+    # ||q - k||^2 = ||q||^2 - 2 (q.k - ||k||^2 / 2), so the nearest k is the argmax
+    scores = known_matrix @ query - half_norm_sq
+    best_idx = int(np.argmax(scores))
+    return best_idx, max(float(query @ query - 2.0 * scores[best_idx]), 0.0)
+
+
+def nearest_encodings(known_matrix, queries, half_norm_sq=None):
+    """
+    nearest_encoding for every row of `queries` (F, 128) at once, without early exit.
+
+    Numba runs one query per core; the NumPy fallback is a single GEMM.
+
+    Returns:
+        tuple: (best_idx, best_sq) arrays, one entry per query; -1 / inf
+               for an empty matrix
+    """
+    if _nearest_encodings is not None:
+        best_idx = np.empty(len(queries), dtype=np.int64)
+        best_sq = np.empty(len(queries), dtype=np.float32)
+        _nearest_encodings(known_matrix, queries, best_idx, best_sq)
+        return best_idx, best_sq
+    if len(known_matrix) == 0:
+        return np.full(len(queries), -1, dtype=np.int64), np.full(len(queries), np.inf, dtype=np.float32)
+    if half_norm_sq is None:
+        half_norm_sq = 0.5 * np.einsum('ij,ij->i', known_matrix, known_matrix)
+    scores = queries @ known_matrix.T
+    scores -= half_norm_sq[None, :]
+    best_idx = scores.argmax(axis=1)
+    best_score = scores[np.arange(len(queries)), best_idx]
+    best_sq = (queries * queries).sum(axis=1) - 2.0 * best_score
+    return best_idx, np.maximum(best_sq, 0.0)
+
+
+def warm_up_matchers():
+    """Compile the Numba matchers now rather than on the first recognized face (no-op without Numba)"""
+    if njit is None:
+        return
+    known = np.zeros((1, ENCODING_DIM), np.float32)
+    nearest_encoding(known, known[0], 0.0)
+    nearest_encodings(known, known)
+    codes, scales, norm_sq = quantize_encodings(known)
+    nearest_encoding_int8(codes, scales, norm_sq, known[0], 0.0)
+
+
+def capture_frames(cap, frames, stop_event):
+    """Keep only the newest camera frame in `frames` (size 1) until stopped.
+
+    Runs on a daemon thread so cap.read() overlaps with recognition. A None
+    frame tells the consumer the camera stopped delivering.
+    """
+    while not stop_event.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            frame = None
+        try:
+            frames.put_nowait(frame)
+        except queue.Full:
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                pass
+            frames.put_nowait(frame)
+        if frame is None:
+            break
+
+
+def detect_and_encode(rgb_small):
+    """Find faces in a downscaled RGB frame and encode them (runs on the detector thread)"""
+    face_locations = face_recognition.face_locations(rgb_small, number_of_times_to_upsample=0, model="hog")
+    if not face_locations:
+        return face_locations, []
+    return face_locations, face_recognition.face_encodings(rgb_small, face_locations)
+
+
+def create_face_tracker():
+    """Create a lightweight OpenCV tracker, or None if this OpenCV build has none"""
+    legacy = getattr(cv2, 'legacy', None)
+    for factory in (getattr(legacy, 'TrackerMOSSE_create', None),
+                    getattr(legacy, 'TrackerKCF_create', None),
+                    getattr(cv2, 'TrackerKCF_create', None)):
+        if factory is not None:
+            return factory()
+    return None
+
+
 def draw_bounding_box(frame, top, right, bottom, left, name, confidence=None):
     """
     Draw a bounding box around a detected face with the person's name.